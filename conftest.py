@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(settings, tmp_path):
+    from core.testing import isolated_caches
+
+    # Поток пула миниатюр пишет в тестовую базу в памяти своим
+    # соединением и ловит «database table is locked»: в тестах
+    # миниатюры рисуются сразу и в отдельном MEDIA_ROOT.
+    settings.THUMBNAIL_WORKERS = 0
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    # Общий кэш — тот же SQLiteCache, но в файле этого теста.
+    settings.CACHES = isolated_caches(str(tmp_path))
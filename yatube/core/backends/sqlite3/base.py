@@ -0,0 +1,17 @@
+"""SQLite, где транзакции сразу берут блокировку записи.
+
+Отложенная транзакция (BEGIN) в режиме WAL, прочитав данные, не может
+начать запись, если другое соединение успело закоммитить: SQLite
+сразу отвечает «database is locked», не дожидаясь busy_timeout. Вьюхи
+под transaction.atomic начинают с SELECT и потом пишут, поэтому
+транзакции здесь открываются BEGIN IMMEDIATE: конкурирующие писатели
+ждут друг друга в busy_timeout ещё до первого чтения.
+"""
+from django.db.backends.sqlite3 import base
+
+BEGIN = 'BEGIN IMMEDIATE'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(BEGIN)
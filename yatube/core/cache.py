@@ -0,0 +1,551 @@
+import math
+import os
+import pickle
+import random
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import CacheMetricsMixin
+
+# Сколько (в долях timeout) устаревшее значение хранится после срока:
+# в это время его отдают, пока один воркер считает новое.
+STALE_FACTOR = 1
+# Срок блокировки пересчёта, если держатель так и не снял её сам.
+LOCK_TIMEOUT = 10
+# Сколько секунд ждать снятия блокировки файла кэша другим процессом.
+BUSY_TIMEOUT = 5
+# Время последнего чтения обновляется не чаще раза в столько секунд:
+# для LRU этого хватает, а чтения почти не превращаются в записи.
+ACCESS_RESOLUTION = 1
+# Число записей проверяется раз в столько set() в каждом процессе.
+CULL_EVERY = 100
+# Многоуровневый кэш: сколько секунд запись живёт в L1 и как часто
+# сверять ключ версии в L2.
+L1_TIMEOUT = 30
+VERSION_CHECK_INTERVAL = 0.3
+VERSION_KEY = 'tiered:version'
+# Ключей в одном запросе IN (...): предел параметров старых SQLite — 999.
+IN_CHUNK = 500
+
+
+def _chunks(items, size=IN_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _encode(value):
+    # Целые храним как есть, чтобы incr был одним UPDATE в SQLite.
+    if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    if isinstance(value, int):
+        return value
+    return pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов на машине.
+
+    LOCATION — путь к файлу. Вытесняются давно не читанные записи
+    (MAX_ENTRIES, CULL_FREQUENCY — как у встроенных бэкендов; число
+    записей проверяется раз в CULL_EVERY записей процесса). incr и add
+    атомарны (BEGIN IMMEDIATE), поэтому на них можно строить счётчики
+    поколений и блокировки между воркерами.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._cull_every = params.get('OPTIONS', {}).get(
+            'CULL_EVERY', CULL_EVERY
+        )
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _connection(self):
+        # Соединение на поток; после fork открываем заново.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self._path, timeout=BUSY_TIMEOUT, isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+            'expires REAL, accessed REAL NOT NULL) WITHOUT ROWID'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)'
+        )
+        return connection
+
+    @contextmanager
+    def _immediate(self):
+        # Транзакция сразу с блокировкой записи: чтение и запись внутри
+        # неё не перемежаются с другими процессами.
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, timeout, now):
+        return (key, _encode(value), self.get_backend_timeout(timeout), now)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._connection.execute(
+            'SELECT value, accessed FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if accessed < now - ACCESS_RESOLUTION:
+            self._connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return _decode(value)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        for chunk in _chunks(list(keys)):
+            marks = ', '.join('?' * len(chunk))
+            rows = self._connection.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({marks}) '
+                'AND (expires IS NULL OR expires > ?)',
+                (*chunk, now),
+            ).fetchall()
+            for key, value in rows:
+                found[keys[key]] = _decode(value)
+            if rows:
+                self._connection.execute(
+                    f'UPDATE cache SET accessed = ? WHERE key IN ({marks}) '
+                    'AND accessed < ?',
+                    (now, *chunk, now - ACCESS_RESOLUTION),
+                )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        row = self._row(self._key(key, version), value, timeout, time.time())
+        self._connection.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', row
+        )
+        self._wrote(1)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [
+            self._row(self._key(key, version), value, timeout, now)
+            for key, value in data.items()
+        ]
+        with self._immediate() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', rows
+            )
+        self._wrote(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        # Без UPSERT (SQLite 3.24+): просроченную запись удаляем в той
+        # же транзакции, что и вставку.
+        with self._immediate() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? '
+                'AND expires IS NOT NULL AND expires <= ?',
+                (row[0], now),
+            )
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)', row
+            )
+        if cursor.rowcount:
+            self._wrote(1)
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        made_key = self._key(key, version)
+        now = time.time()
+        # Без RETURNING (SQLite 3.35+): новое значение читаем в той же
+        # транзакции, что и UPDATE.
+        with self._immediate() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET value = value + ?, accessed = ? '
+                "WHERE key = ? AND typeof(value) = 'integer' "
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, now, made_key, now),
+            )
+            if not cursor.rowcount:
+                raise ValueError(f"Key '{key}' not found")
+            return connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (made_key,)
+            ).fetchone()[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version), now),
+        )
+        return bool(cursor.rowcount)
+
+    def has_key(self, key, version=None):
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for chunk in _chunks(keys):
+            self._connection.execute(
+                'DELETE FROM cache WHERE key IN ({})'.format(
+                    ', '.join('?' * len(chunk))
+                ),
+                chunk,
+            )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def _wrote(self, count):
+        self._writes += count
+        if self._writes >= self._cull_every:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+        else:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+
+class TieredCache(BaseCache):
+    """LRU в памяти процесса (L1) перед общим кэшем (L2).
+
+    LOCATION — имя кэша L2 в CACHES, MAX_ENTRIES — размер L1. Запись
+    живёт в L1 не дольше L1_TIMEOUT секунд. incr, decr, delete и clear
+    меняют ключ версии в L2; остальные процессы сверяют его не чаще
+    раза в VERSION_CHECK_INTERVAL секунд и при расхождении очищают L1.
+    set такую проверку не запускает: ключи проекта версионные (в них
+    входит поколение), а перезапись по тому же ключу — обновление
+    того же значения. Записи single_flight хранят поколение в самой
+    записи и старую копию в L1 распознают сами. Ключи с окончаниями
+    из L1_SKIP_SUFFIXES (блокировки) всегда идут в L2 и версию
+    не меняют.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = location
+        self._l1_timeout = options.get('L1_TIMEOUT', L1_TIMEOUT)
+        self._check_interval = options.get(
+            'VERSION_CHECK_INTERVAL', VERSION_CHECK_INTERVAL
+        )
+        self._skip = tuple(options.get('L1_SKIP_SUFFIXES', ()))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = None
+        self.counters = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0
+        )
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _local(self, key, version):
+        if key.endswith(self._skip):
+            return None
+        return self.make_key(key, version)
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._checked is not None and (
+            now - self._checked < self._check_interval
+        ):
+            return
+        self._checked = now
+        version = self.l2.get(VERSION_KEY)
+        with self._lock:
+            if version != self._version:
+                self._l1.clear()
+                self._version = version
+
+    def _invalidate(self, local_keys):
+        try:
+            version = self.l2.incr(VERSION_KEY)
+        except ValueError:
+            version = int(time.time() * 1000)
+            self.l2.set(VERSION_KEY, version, None)
+        with self._lock:
+            if self._version is not None and version == self._version + 1:
+                for local_key in local_keys:
+                    self._l1.pop(local_key, None)
+            else:
+                # Версию успел сменить кто-то ещё.
+                self._l1.clear()
+            self._version = version
+
+    def _lookup(self, local_key):
+        with self._lock:
+            entry = self._l1.get(local_key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._l1[local_key]
+                return None
+            self._l1.move_to_end(local_key)
+            return entry
+
+    def _store(self, local_key, value, timeout=DEFAULT_TIMEOUT):
+        if local_key is None:
+            return
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        lifetime = self._l1_timeout
+        if timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            self._drop([local_key])
+            return
+        # Изменяемые значения копируем, как это делает LocMemCache.
+        if not isinstance(value, (str, bytes, int, float, type(None))):
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            entry = (value, time.monotonic() + lifetime, True)
+        else:
+            entry = (value, time.monotonic() + lifetime, False)
+        with self._lock:
+            self._l1[local_key] = entry
+            self._l1.move_to_end(local_key)
+            while len(self._l1) > self._max_entries:
+                self._l1.popitem(last=False)
+
+    def _drop(self, local_keys):
+        with self._lock:
+            for local_key in local_keys:
+                self._l1.pop(local_key, None)
+
+    @staticmethod
+    def _value(entry):
+        value, _, pickled = entry
+        return pickle.loads(value) if pickled else value
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        local_key = self._local(key, version)
+        if local_key is not None:
+            entry = self._lookup(local_key)
+            if entry is not None:
+                self._count('l1_hits')
+                return self._value(entry)
+        self._count('l1_misses')
+        sentinel = object()
+        value = self.l2.get(key, sentinel, version)
+        if value is sentinel:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self._store(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            local_key = self._local(key, version)
+            entry = local_key and self._lookup(local_key)
+            if entry:
+                found[key] = self._value(entry)
+            else:
+                missing.append(key)
+        self._count('l1_hits', len(found))
+        self._count('l1_misses', len(missing))
+        if missing:
+            fetched = self.l2.get_many(missing, version)
+            self._count('l2_hits', len(fetched))
+            self._count('l2_misses', len(missing) - len(fetched))
+            for key, value in fetched.items():
+                self._store(self._local(key, version), value)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        self._sync()
+        local_key = self._local(key, version)
+        if local_key is not None and self._lookup(local_key) is not None:
+            return True
+        return self.l2.has_key(key, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self._store(self._local(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._store(self._local(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self._store(self._local(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        self._changed([key], version)
+        return value
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version)
+        self._changed([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version)
+        self._changed(keys, version)
+
+    def _changed(self, keys, version):
+        local_keys = [self._local(key, version) for key in keys]
+        local_keys = [key for key in local_keys if key is not None]
+        if local_keys:
+            self._invalidate(local_keys)
+
+    def clear(self):
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+            self._version = None
+            self._checked = None
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedSQLiteCache(CacheMetricsMixin, SQLiteCache):
+    pass
+
+
+class InstrumentedTieredCache(CacheMetricsMixin, TieredCache):
+    pass
+
+
+def _expired(expiry, delta, beta):
+    # XFetch: чем дороже пересчёт (delta) и ближе срок, тем вероятнее
+    # обновить значение заранее, не дожидаясь истечения у всех сразу.
+    return time.time() - delta * beta * math.log(1 - random.random()) >= (
+        expiry
+    )
+
+
+def single_flight(key, compute, timeout, cache=None, beta=1.0,
+                  lock_timeout=None, generation=None):
+    """Значение из кэша; устаревшее пересчитывает один воркер.
+
+    Пока держатель блокировки (cache.add) считает новое значение,
+    остальные сразу получают устаревшее. Если отдать нечего, запрос
+    считает значение сам, не дожидаясь чужого результата: поток
+    запроса не спит. timeout=None — хранить без срока.
+
+    generation хранится в записи, а не в ключе: после смены поколения
+    запись с прежним считается устаревшей и отдаётся, пока её
+    пересчитывает один воркер. С поколением в ключе каждая запись
+    данных давала бы пустой ключ, и пересчитывали бы все запросы сразу.
+    """
+    cache = cache or caches['default']
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expiry, entry_generation = entry
+        if entry_generation == generation and (
+            expiry is None or not _expired(expiry, delta, beta)
+        ):
+            return value
+    token = secrets.token_hex(8)
+    locked = cache.add(lock_key, token, lock_timeout or LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        return entry[0]
+    try:
+        start = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - start
+        if timeout is None:
+            cache.set(key, (value, delta, None, generation), None)
+        else:
+            cache.set(
+                key,
+                (value, delta, time.time() + timeout, generation),
+                timeout * (1 + STALE_FACTOR),
+            )
+    finally:
+        # Блокировку могли отдать другому по истечении срока: снимаем
+        # только свою.
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Max
+
+# Сколько секунд хранится оценка размера таблицы.
+ESTIMATE_TIMEOUT = 60
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Настраивает каждое новое соединение SQLite из SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+def table_estimate(model):
+    """Примерное число строк таблицы модели без COUNT(*).
+
+    PostgreSQL берёт его из статистики (pg_class.reltuples), остальные
+    базы — из наибольшего первичного ключа (O(log n) по индексу).
+    MAX(pk) не знает об удалённых строках: после удалений оценка
+    завышена на их число, и пагинатор может обещать лишние страницы
+    (последняя неполная страница обрезает num_pages). Оценка
+    кэшируется на ESTIMATE_TIMEOUT секунд.
+    """
+    key = f'estimate:{model._meta.db_table}'
+    estimate = cache.get(key)
+    if estimate is not None:
+        return estimate
+    manager = model._base_manager
+    connection = connections[manager.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass',
+                [model._meta.db_table],
+            )
+            estimate = max(cursor.fetchone()[0], 0)
+    else:
+        estimate = manager.aggregate(last=Max('pk'))['last'] or 0
+    cache.set(key, estimate, ESTIMATE_TIMEOUT)
+    return estimate
@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+# Размер значения — порядка закэшированного фрагмента ленты
+VALUE = 'x' * 2048
+COUNTER = 'bench:counter'
+
+
+def _cache(backend, directory):
+    location = os.path.join(directory, backend)
+    if backend == 'sqlite':
+        location += '.sqlite3'
+    return import_string(BACKENDS[backend])(
+        location, {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}
+    )
+
+
+def _worker(backend, directory, keys, seconds, incr_ratio, results):
+    cache = _cache(backend, directory)
+    cache.add(COUNTER, 0)
+    hits = misses = increments = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if random.random() < incr_ratio:
+            cache.incr(COUNTER)
+            increments += 1
+            continue
+        # Популярные ключи читаются чаще, как страницы лент.
+        key = f'bench:{int(random.paretovariate(1)) % keys}'
+        if cache.get(key) is None:
+            misses += 1
+            cache.set(key, VALUE)
+        else:
+            hits += 1
+    results.put((hits, misses, increments))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает бэкенды кэша (locmem, filebased, sqlite) '
+        'под нагрузкой из нескольких процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--incr-ratio', type=float, default=0.05)
+        parser.add_argument(
+            '--backends', nargs='*', choices=BACKENDS, default=list(BACKENDS),
+        )
+
+    def run(self, backend, options):
+        with tempfile.TemporaryDirectory() as directory:
+            results = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(
+                    target=_worker,
+                    args=(
+                        backend, directory, options['keys'],
+                        options['seconds'], options['incr_ratio'], results,
+                    ),
+                )
+                for _ in range(options['workers'])
+            ]
+            for worker in workers:
+                worker.start()
+            hits, misses, increments = (sum(column) for column in zip(
+                *(results.get() for _ in workers)
+            ))
+            for worker in workers:
+                worker.join()
+            counter = _cache(backend, directory).get(COUNTER)
+        return hits, misses, increments, counter
+
+    def handle(self, *args, **options):
+        seconds = options['seconds']
+        for backend in options['backends']:
+            hits, misses, increments, counter = self.run(backend, options)
+            # Счётчик locmem живёт в памяти воркера и родителю не виден.
+            lost = '—' if counter is None else increments - counter
+            rate = (hits + misses + increments) / seconds
+            self.stdout.write(
+                f'{backend:<10} операций {rate:>9.0f}/с  '
+                f'попаданий {hits / max(hits + misses, 1):>6.1%}  '
+                f'потеряно incr {lost}'
+            )
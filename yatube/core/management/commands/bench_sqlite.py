@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.backends.sqlite3.base import BEGIN
+
+ROWS = 10000
+
+
+def _connect(path, pragmas, timeout):
+    # Транзакции открываются явно: BEGIN или BEGIN IMMEDIATE
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    for pragma, value in pragmas.items():
+        connection.execute(f'PRAGMA {pragma} = {value}')
+    return connection
+
+
+def _prepare(path, pragmas):
+    connection = _connect(path, pragmas, 5)
+    connection.execute(
+        'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+        'pub_date REAL, text TEXT)'
+    )
+    connection.execute(
+        'CREATE INDEX post_author_pub_date ON post (author_id, pub_date DESC)'
+    )
+    connection.executemany(
+        'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)',
+        (
+            (random.randrange(100), time.time(), 'x' * 200)
+            for _ in range(ROWS)
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+
+def _worker(path, pragmas, timeout, begin, seconds, write_ratio, results):
+    connection = _connect(path, pragmas, timeout)
+    reads = writes = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            if random.random() < write_ratio:
+                # Как вьюха под transaction.atomic: сначала читает,
+                # потом пишет в той же транзакции.
+                author_id = random.randrange(100)
+                connection.execute(begin)
+                connection.execute(
+                    'SELECT MAX(pub_date) FROM post WHERE author_id = ?',
+                    (author_id,),
+                ).fetchone()
+                connection.execute(
+                    'INSERT INTO post (author_id, pub_date, text) '
+                    'VALUES (?, ?, ?)',
+                    (author_id, time.time(), 'x' * 200),
+                )
+                connection.execute('COMMIT')
+                writes += 1
+            else:
+                connection.execute(
+                    'SELECT id, text FROM post WHERE author_id = ? '
+                    'ORDER BY pub_date DESC LIMIT 10',
+                    (random.randrange(100),),
+                ).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            errors += 1
+    connection.close()
+    results.put((reads, writes, errors))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает конкурентные чтения и записи SQLite со стандартными '
+        'настройками и с SQLITE_PRAGMAS и BEGIN IMMEDIATE'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=5,
+            help='Ожидание блокировки для стандартной конфигурации, сек. '
+                 '(5 — значение sqlite3 по умолчанию)',
+        )
+
+    def run(self, pragmas, timeout, begin, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            _prepare(path, pragmas)
+            results = multiprocessing.Queue()
+            workers = [
+                multiprocessing.Process(
+                    target=_worker,
+                    args=(
+                        path, pragmas, timeout, begin, options['seconds'],
+                        options['write_ratio'], results,
+                    ),
+                )
+                for _ in range(options['workers'])
+            ]
+            for worker in workers:
+                worker.start()
+            totals = [sum(column) for column in zip(
+                *(results.get() for _ in workers)
+            )]
+            for worker in workers:
+                worker.join()
+        return totals
+
+    def handle(self, *args, **options):
+        configs = {
+            'stock': ({}, options['timeout'], 'BEGIN'),
+            'tuned': (
+                settings.SQLITE_PRAGMAS,
+                settings.DATABASES['default']['OPTIONS']['timeout'],
+                BEGIN,
+            ),
+        }
+        seconds = options['seconds']
+        for name, (pragmas, timeout, begin) in configs.items():
+            reads, writes, errors = self.run(pragmas, timeout, begin, options)
+            self.stdout.write(
+                f'{name}: чтений {reads / seconds:.0f}/с, '
+                f'записей {writes / seconds:.0f}/с, '
+                f'ошибок блокировки {errors}'
+            )
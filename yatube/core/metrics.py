@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.backends.django import DjangoTemplates, Template
+
+# Верхние границы корзин гистограммы задержки, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNTERS = (
+    'db_queries', 'db_seconds', 'cache_hits', 'cache_misses',
+    'template_seconds',
+)
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Стоимость одного запроса; копится, пока он обрабатывается."""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_seconds = 0.0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.db_queries += 1
+
+
+def current():
+    """Статистика запроса, обрабатываемого в этом потоке, или None."""
+    return getattr(_local, 'stats', None)
+
+
+def start_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def finish_request():
+    _local.stats = None
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+
+class Registry:
+    """Накопленные метрики процесса по именам маршрутов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+
+    def observe(self, view, seconds, stats):
+        with self._lock:
+            metrics = self._views[view]
+            metrics.count += 1
+            metrics.seconds += seconds
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    metrics.buckets[index] += 1
+            for name in COUNTERS:
+                metrics.totals[name] += getattr(stats, name)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = [
+                '# TYPE yatube_request_duration_seconds histogram',
+            ]
+            for view, metrics in views:
+                label = f'view="{view}"'
+                for bound, value in zip(BUCKETS, metrics.buckets):
+                    lines.append(
+                        'yatube_request_duration_seconds_bucket'
+                        f'{{{label},le="{bound}"}} {value}'
+                    )
+                lines.append(
+                    'yatube_request_duration_seconds_bucket'
+                    f'{{{label},le="+Inf"}} {metrics.count}'
+                )
+                lines.append(
+                    'yatube_request_duration_seconds_sum'
+                    f'{{{label}}} {metrics.seconds}'
+                )
+                lines.append(
+                    'yatube_request_duration_seconds_count'
+                    f'{{{label}}} {metrics.count}'
+                )
+            for name in COUNTERS:
+                lines.append(f'# TYPE yatube_{name}_total counter')
+                for view, metrics in views:
+                    lines.append(
+                        f'yatube_{name}_total{{view="{view}"}} '
+                        f'{metrics.totals[name]}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def render_cache_tiers():
+    """Попадания и промахи по уровням многоуровневых кэшей."""
+    tiered = [
+        (alias, caches[alias].counters) for alias in settings.CACHES
+        if hasattr(caches[alias], 'counters')
+    ]
+    lines = []
+    for kind in ('hits', 'misses'):
+        lines.append(f'# TYPE yatube_cache_tier_{kind}_total counter')
+        for alias, counters in tiered:
+            for tier in ('l1', 'l2'):
+                lines.append(
+                    f'yatube_cache_tier_{kind}_total'
+                    f'{{cache="{alias}",tier="{tier}"}} '
+                    f'{counters[f"{tier}_{kind}"]}'
+                )
+    return '\n'.join(lines) + '\n'
+
+
+class CacheMetricsMixin:
+    """Считает попадания и промахи кэша для текущего запроса."""
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = super().get(key, sentinel, version)
+        stats = current()
+        if stats is not None:
+            if value is sentinel:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is sentinel else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        stats = current()
+        if stats is not None:
+            stats.cache_hits += len(found)
+            stats.cache_misses += len(keys) - len(found)
+        return found
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонный движок Django, засекающий время отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,101 @@
+"""Кэш целых страниц с «дырами» под пользовательские фрагменты.
+
+Страница рендерится один раз как оболочка: вместо фрагментов, которые
+зависят от пользователя (тег {% hole %}), в неё попадают метки. Для
+каждого запроса дыры дорисовываются отдельно, а анонимная версия
+страницы кэшируется целиком.
+"""
+import hashlib
+import secrets
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+HOLE = '<!--hole:{token}:{index}-->'
+
+
+class Shell:
+    """Дыры, встреченные при рендере оболочки."""
+
+    def __init__(self):
+        # Случайный токен не даёт подделать метку в тексте поста.
+        self.token = secrets.token_hex(8)
+        self.holes = []
+
+    def add(self, template_name, kwargs):
+        self.holes.append((template_name, kwargs))
+        return HOLE.format(token=self.token, index=len(self.holes) - 1)
+
+
+def render_hole(request, template_name, kwargs):
+    return render_to_string(template_name, kwargs, request=request)
+
+
+def fill(shell, request):
+    content = shell['content']
+    for index, (template_name, kwargs) in enumerate(shell['holes']):
+        content = content.replace(
+            HOLE.format(token=shell['token'], index=index),
+            render_hole(request, template_name, kwargs),
+            1,
+        )
+    return content
+
+
+def cache_page_shell(version_func, timeout=None, prefix='page'):
+    """Кэширует страницу, пока version_func(request, ...) не изменится.
+
+    version_func должна учитывать адрес и все данные страницы, кроме
+    пользовательских фрагментов. При нулевом сроке страница каждый раз
+    рендерится заново.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            cache_timeout = (
+                settings.PAGE_CACHE_TIMEOUT if timeout is None else timeout
+            )
+            if request.method not in ('GET', 'HEAD') or not cache_timeout:
+                return view(request, *args, **kwargs)
+            version = version_func(request, *args, **kwargs)
+            key = '{}:{}:{}'.format(
+                prefix, view.__name__,
+                hashlib.md5(version.encode()).hexdigest(),
+            )
+            anonymous = not request.user.is_authenticated
+            if anonymous:
+                page = cache.get(f'{key}:anonymous')
+                if page is not None:
+                    return HttpResponse(
+                        page['content'], content_type=page['content_type']
+                    )
+            shell = cache.get(key)
+            if shell is None:
+                request.page_shell = Shell()
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    page_shell = request.page_shell
+                    del request.page_shell
+                if response.status_code != 200 or response.streaming:
+                    return response
+                shell = {
+                    'content': response.content.decode(response.charset),
+                    'content_type': response['Content-Type'],
+                    'token': page_shell.token,
+                    'holes': page_shell.holes,
+                }
+                cache.set(key, shell, cache_timeout)
+            content = fill(shell, request)
+            if anonymous:
+                page = {
+                    'content': content,
+                    'content_type': shell['content_type'],
+                }
+                cache.set(f'{key}:anonymous', page, cache_timeout)
+            return HttpResponse(content, content_type=shell['content_type'])
+        return wrapper
+    return decorator
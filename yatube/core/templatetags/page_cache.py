@@ -0,0 +1,46 @@
+from django import template
+from django.template.base import token_kwargs
+
+from core.page_cache import render_hole
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, extra_context):
+        self.template_name = template_name
+        self.extra_context = extra_context
+
+    def render(self, context):
+        template_name = self.template_name.resolve(context)
+        kwargs = {
+            name: value.resolve(context)
+            for name, value in self.extra_context.items()
+        }
+        request = context.get('request')
+        shell = getattr(request, 'page_shell', None)
+        if shell is None:
+            return render_hole(request, template_name, kwargs)
+        return shell.add(template_name, kwargs)
+
+
+@register.tag
+def hole(parser, token):
+    """{% hole 'шаблон.html' имя=значение ... %}
+
+    Фрагмент, который рисуется для каждого запроса отдельно, даже
+    если страница взята из кэша. Шаблон видит только переданные
+    значения и контекстные процессоры; значения должны быть простыми
+    (строки, числа), потому что хранятся в кэше вместе со страницей.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает имя шаблона'
+        )
+    extra_context = token_kwargs(bits[2:], parser)
+    if len(extra_context) != len(bits) - 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает только именованные значения'
+        )
+    return HoleNode(parser.compile_filter(bits[1]), extra_context)
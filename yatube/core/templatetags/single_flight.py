@@ -0,0 +1,89 @@
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Library, TemplateSyntaxError, VariableDoesNotExist
+from django.template.base import Token
+from django.templatetags.cache import CacheNode, do_cache
+
+from core.cache import single_flight
+
+register = Library()
+
+
+class SingleFlightCacheNode(CacheNode):
+    def __init__(self, *args, generation=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.generation = generation
+
+    def fragment_cache(self, context):
+        if not self.cache_name:
+            try:
+                return caches['template_fragments']
+            except InvalidCacheBackendError:
+                return caches['default']
+        try:
+            cache_name = self.cache_name.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError(
+                f'"cache" tag got an unknown variable: '
+                f'{self.cache_name.var!r}'
+            )
+        try:
+            return caches[cache_name]
+        except InvalidCacheBackendError:
+            raise TemplateSyntaxError(
+                f'Invalid cache name specified for cache tag: {cache_name!r}'
+            )
+
+    def expire_time(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError(
+                f'"cache" tag got an unknown variable: '
+                f'{self.expire_time_var.var!r}'
+            )
+        if expire_time is None:
+            return None
+        try:
+            return int(expire_time)
+        except (ValueError, TypeError):
+            raise TemplateSyntaxError(
+                f'"cache" tag got a non-integer timeout value: '
+                f'{expire_time!r}'
+            )
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return single_flight(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context),
+            self.expire_time(context),
+            cache=self.fragment_cache(context),
+            generation=(
+                self.generation.resolve(context) if self.generation else None
+            ),
+        )
+
+
+@register.tag('cache')
+def do_single_flight_cache(parser, token):
+    """{% cache %} с защитой от одновременного пересчёта.
+
+    Синтаксис тот же, что у встроенного тега, и необязательный
+    последний аргумент generation=<переменная>. Истёкший фрагмент или
+    фрагмент прошлого поколения перерисовывает один запрос, остальные
+    до этого получают старую версию; близкие к сроку фрагменты иногда
+    обновляются заранее.
+    """
+    bits = token.split_contents()
+    generation = None
+    if bits[-1].startswith('generation='):
+        generation = parser.compile_filter(bits.pop()[len('generation='):])
+        token = Token(
+            token.token_type, ' '.join(bits), token.position, token.lineno
+        )
+    node = do_cache(parser, token)
+    return SingleFlightCacheNode(
+        node.nodelist, node.expire_time_var, node.fragment_name,
+        node.vary_on, node.cache_name, generation=generation,
+    )
@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Context, Template
+from django.test import TestCase
+
+from core.cache import (VERSION_KEY, SQLiteCache, TieredCache,
+                        single_flight)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_fresh_value_is_cached(self):
+        '''Свежее значение считается один раз'''
+        self.assertEqual(single_flight('key', self.compute, 60), 1)
+        self.assertEqual(single_flight('key', self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_locked(self):
+        '''Пока пересчёт занят другим, отдаётся устаревшее значение'''
+        single_flight('key', self.compute, 60)
+        with mock.patch('core.cache.time.time', return_value=time.time() + 61):
+            cache.add('key:lock', 1)
+            self.assertEqual(single_flight('key', self.compute, 60), 1)
+            self.assertEqual(self.calls, 1)
+            cache.delete('key:lock')
+            self.assertEqual(single_flight('key', self.compute, 60), 2)
+
+    def test_miss_while_locked_computes_without_waiting(self):
+        '''Без устаревшего значения запрос считает сам и не спит'''
+        cache.add('key:lock', 'other')
+        with mock.patch('core.cache.time.sleep') as sleep:
+            self.assertEqual(single_flight('key', self.compute, 60), 1)
+        sleep.assert_not_called()
+        self.assertEqual(cache.get('key:lock'), 'other')
+
+    def test_foreign_lock_not_released(self):
+        '''Чужую блокировку, взятую за время пересчёта, не снимают'''
+        def slow():
+            # Срок нашей блокировки вышел, её взял другой воркер.
+            cache.set('key:lock', 'other')
+            return self.compute()
+
+        self.assertEqual(single_flight('key', slow, 60), 1)
+        self.assertEqual(cache.get('key:lock'), 'other')
+        single_flight('other', self.compute, 60)
+        self.assertIsNone(cache.get('other:lock'))
+
+    def test_early_refresh(self):
+        '''Близкое к сроку значение иногда обновляется заранее'''
+        # Значение считалось 10 с и истекает через 5 с.
+        cache.set('key', (0, 10, time.time() + 5, None), 120)
+        with mock.patch('core.cache.random.random', return_value=0.01):
+            self.assertEqual(single_flight('key', self.compute, 60), 0)
+        with mock.patch('core.cache.random.random', return_value=0.5):
+            self.assertEqual(single_flight('key', self.compute, 60), 1)
+
+    def test_stampede_after_generation_bump(self):
+        '''После смены поколения пересчитывает один, остальным — старое'''
+        single_flight('key', self.compute, 60, generation=1)
+        cache.add('key:lock', 'other')
+        for _ in range(3):
+            self.assertEqual(
+                single_flight('key', self.compute, 60, generation=2), 1
+            )
+        self.assertEqual(self.calls, 1)
+        cache.delete('key:lock')
+        self.assertEqual(
+            single_flight('key', self.compute, 60, generation=2), 2
+        )
+        self.assertEqual(
+            single_flight('key', self.compute, 60, generation=2), 2
+        )
+
+    def test_template_tag(self):
+        '''{% cache %} из single_flight кэширует фрагмент по ключам'''
+        template = Template(
+            '{% load single_flight %}'
+            '{% cache 60 fragment key %}{{ value }}{% endcache %}'
+        )
+
+        def render(**kwargs):
+            return template.render(Context(kwargs))
+
+        self.assertEqual(render(key=1, value='a'), 'a')
+        self.assertEqual(render(key=1, value='b'), 'a')
+        self.assertEqual(render(key=2, value='b'), 'b')
+
+    def test_template_tag_generation(self):
+        '''Поколение фрагмента не входит в ключ, а устаревает запись'''
+        template = Template(
+            '{% load single_flight %}'
+            '{% cache 60 fragment key generation=generation %}'
+            '{{ value }}{% endcache %}'
+        )
+
+        def render(**kwargs):
+            return template.render(Context(kwargs))
+
+        self.assertEqual(render(key=1, generation=1, value='a'), 'a')
+        self.assertEqual(render(key=1, generation=1, value='b'), 'a')
+        cache_key = make_template_fragment_key('fragment', [1])
+        cache.add(f'{cache_key}:lock', 'other')
+        self.assertEqual(render(key=1, generation=2, value='b'), 'a')
+        cache.delete(f'{cache_key}:lock')
+        self.assertEqual(render(key=1, generation=2, value='b'), 'b')
+
+
+def _increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_set_get_expire(self):
+        '''Значения любых типов читаются обратно и истекают в срок'''
+        self.cache.set('int', 1)
+        self.cache.set('dict', {'a': [1, 2]})
+        self.cache.set('short', 'x', 1)
+        self.assertEqual(self.cache.get('int'), 1)
+        self.assertEqual(self.cache.get('dict'), {'a': [1, 2]})
+        self.assertEqual(self.make_cache().get('short'), 'x')
+        with mock.patch('core.cache.time.time', return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get('short'))
+            self.assertTrue(self.cache.add('short', 'y'))
+        self.assertFalse(self.cache.add('int', 2))
+        self.assertEqual(self.cache.get('int'), 1)
+
+    def test_tests_use_site_backends(self):
+        '''Тесты идут на тех же бэкендах кэша, что и сайт'''
+        self.assertIsInstance(caches['default'], TieredCache)
+        self.assertIsInstance(caches['shared'], SQLiteCache)
+
+    def test_incr_missing_and_expired(self):
+        '''incr не находит отсутствующие, просроченные и нечисловые ключи'''
+        self.cache.set('counter', 5, 1)
+        self.cache.set('text', 'x')
+        self.assertEqual(self.cache.incr('counter', 2), 7)
+        for key in ('missing', 'text'):
+            with self.assertRaises(ValueError):
+                self.cache.incr(key)
+        with mock.patch('core.cache.time.time', return_value=time.time() + 2):
+            with self.assertRaises(ValueError):
+                self.cache.incr('counter')
+
+    def test_get_many_set_many(self):
+        self.cache.set_many({'a': 1, 'b': 'два'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 'два'}
+        )
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_incr_is_atomic_across_processes(self):
+        '''Параллельные incr из разных процессов не теряются'''
+        self.cache.set('counter', 0)
+        workers = [
+            multiprocessing.Process(
+                target=_increment, args=(self.location, 200)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 800)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_cull_evicts_least_recently_used(self):
+        '''При переполнении вытесняются давно не читанные записи'''
+        cache = self.make_cache(
+            MAX_ENTRIES=10, CULL_FREQUENCY=2, CULL_EVERY=1
+        )
+        now = time.time()
+        for index in range(10):
+            with mock.patch('core.cache.time.time', return_value=now + index):
+                cache.set(index, index)
+        with mock.patch('core.cache.time.time', return_value=now + 20):
+            cache.get(0)
+            cache.set('new', 1)
+        self.assertEqual(cache.get(0), 0)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(9), 9)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # Два экземпляра — как два воркера над общим L2.
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    def make_cache(self):
+        return TieredCache('shared', {
+            'OPTIONS': {
+                'MAX_ENTRIES': 2,
+                'VERSION_CHECK_INTERVAL': 60,
+                'L1_SKIP_SUFFIXES': [':lock'],
+            },
+        })
+
+    def test_hits_served_from_l1(self):
+        '''Повторное чтение не ходит в L2; счётчики ведутся по уровням'''
+        self.first.set('key', {'a': 1})
+        caches['shared'].delete('key')
+        self.assertEqual(self.first.get('key'), {'a': 1})
+        self.assertIsNone(self.second.get('key'))
+        self.assertEqual(self.first.counters['l1_hits'], 1)
+        self.assertEqual(self.second.counters['l2_misses'], 1)
+
+    def test_l1_is_bounded_lru(self):
+        for key in ('a', 'b', 'c'):
+            self.first.set(key, key)
+        caches['shared'].clear()
+        self.assertIsNone(self.first.get('a'))
+        self.assertEqual(self.first.get('c'), 'c')
+
+    def test_incr_invalidates_other_processes(self):
+        '''После incr другие процессы сверяют версию и сбрасывают L1'''
+        self.first.set('generation', 1)
+        self.assertEqual(self.second.get('generation'), 1)
+        self.first.incr('generation')
+        self.assertEqual(self.first.get('generation'), 2)
+        # Версия ещё не сверялась: отдаём значение из L1.
+        self.assertEqual(self.second.get('generation'), 1)
+        self.second._checked = None
+        self.assertEqual(self.second.get('generation'), 2)
+
+    def test_skipped_keys_bypass_l1(self):
+        self.assertTrue(self.first.add('fragment:lock', 1))
+        self.assertFalse(self.second.add('fragment:lock', 1))
+        self.first.delete('fragment:lock')
+        self.assertTrue(self.second.add('fragment:lock', 1))
+        self.assertNotIn(VERSION_KEY, caches['shared'].get_many([
+            VERSION_KEY
+        ]))
@@ -0,0 +1,29 @@
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.backends.sqlite3.base import BEGIN
+
+
+class SqlitePragmasTests(TestCase):
+    def test_pragmas_applied(self):
+        """Новое соединение SQLite получает настройки из SQLITE_PRAGMAS."""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # 1 — NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            # 2 — MEMORY
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class SqliteTransactionTests(TransactionTestCase):
+    def test_atomic_begins_immediate(self):
+        """transaction.atomic сразу берёт блокировку записи."""
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+        self.assertEqual(queries[0]['sql'], BEGIN)
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.metrics import registry
+
+User = get_user_model()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = Client()
+
+    def test_metrics_per_view(self):
+        """Метрики копятся по имени маршрута и отдаются на /metrics/."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            body
+        )
+        for name in (
+            'db_queries', 'cache_hits', 'cache_misses', 'template_seconds'
+        ):
+            with self.subTest(name=name):
+                self.assertGreater(self.metric(body, name, 'posts:index'), 0)
+        self.assertIn(
+            'yatube_cache_tier_hits_total{cache="default",tier="l1"}', body
+        )
+
+    def metric(self, body, name, view):
+        prefix = f'yatube_{name}_total{{view="{view}"}} '
+        for line in body.splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+        self.fail(f'Нет метрики {prefix}')
+
+    def test_metrics_hidden_from_public(self):
+        """Снаружи /metrics/ не виден."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='203.0.113.5'
+        )
+        self.assertEqual(response.status_code, 404)
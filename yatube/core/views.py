@@ -1,6 +1,10 @@
 # core/views.py
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .metrics import registry, render_cache_tiers
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -18,3 +22,17 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики процесса в формате Prometheus (для INTERNAL_IPS и staff)."""
+    allowed = (
+        request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        or request.user.is_staff
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(
+        registry.render() + render_cache_tiers(),
+        content_type='text/plain; version=0.0.4'
+    )
@@ -1,26 +1,99 @@
+from functools import partial
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+
+from core.db import table_estimate
 
+from . import counters
 from .models import Group, Post, Comment, Follow
+from .paginators import EstimatedCountPaginator
+from .search import filter_posts
+
+
+class EstimatedChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        self.estimated = self.paginator.estimated
+
+
+class EstimatedCountAdmin(admin.ModelAdmin):
+    """Список без COUNT(*) по всей таблице, если она велика.
+
+    Без фильтров и поиска размер берётся из table_estimate; с ними
+    считается точно. Общий счётчик «из N» не показывается.
+    """
+    show_full_result_count = False
 
+    def get_changelist(self, request, **kwargs):
+        return EstimatedChangeList
 
-class PostAdmin(admin.ModelAdmin):
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        estimate = None
+        if not queryset.query.where:
+            estimate = partial(table_estimate, queryset.model)
+        return EstimatedCountPaginator(
+            queryset, per_page, estimate=estimate, orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+        )
+
+
+class CountersAdmin(admin.ModelAdmin):
+    """Правка записи не затирает её счётчики (см. posts.counters)."""
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=counters.edited_fields(form))
+        else:
+            super().save_model(request, obj, form, change)
+
+
+class PostAdmin(CountersAdmin, EstimatedCountAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
 
+    def get_changelist_formset(self, request, **kwargs):
+        formset = super().get_changelist_formset(request, **kwargs)
+        field = formset.form.base_fields['group']
+        # В list_editable у каждой строки свой <select>: группы читаем
+        # один раз на формсет, а не на строку. Группу, созданную или
+        # удалённую, пока идёт запрос, список не увидит; сохранение
+        # всё равно проверяет значение по queryset поля.
+        # iter(): list() спросил бы у ModelChoiceIterator длину — COUNT(*).
+        field.choices = list(iter(field.choices))
+        # Select внутри RelatedFieldWidgetWrapper получает тот же список.
+        getattr(field.widget, 'widget', field.widget).choices = field.choices
+        return formset
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через FTS5, а не LIKE '%...%'
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
 
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(CountersAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
+    search_fields = ('title', 'slug')
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(EstimatedCountAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
+    list_select_related = ('post', 'author')
+    raw_id_fields = ('post',)
+    autocomplete_fields = ('author',)
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(Post, PostAdmin)
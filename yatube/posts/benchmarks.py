@@ -0,0 +1,240 @@
+"""Замеры представлений posts через тестовый клиент.
+
+Для каждого сценария считаются p50/p95 времени ответа, число
+запросов к базе и пик памяти Python на запрос. Результаты
+сравниваются с сохранённой базовой линией.
+
+По умолчанию кэш целых страниц (core.page_cache) выключен: иначе
+анонимные сценарии меряли бы чтение из кэша, а не работу
+представления. Режим warm оставляет его включённым.
+"""
+import json
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import AuthorStats, Follow, Group, Post
+
+User = get_user_model()
+
+# Насколько (в долях) можно ухудшить p95 и пик памяти.
+DEFAULT_THRESHOLD = 0.2
+# Разница меньше этой (мс, КиБ) считается шумом.
+LATENCY_SLACK = 2
+MEMORY_SLACK = 64
+
+
+class Scenario(namedtuple(
+    'Scenario', 'name method url data login prepare status'
+)):
+    """Один запрос к представлению.
+
+    prepare вызывается перед каждым запросом и в замер не входит.
+    """
+
+    def __new__(cls, name, url, method='get', data=None, login=False,
+                prepare=None, status=200):
+        return super().__new__(
+            cls, name, method, url, data, login, prepare, status
+        )
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(share * len(ordered)))
+    return ordered[rank - 1]
+
+
+def sample():
+    """Самые нагруженные объекты набора: на них и меряем."""
+    author = AuthorStats.objects.order_by('-posts_count').first().user
+    reader = AuthorStats.objects.order_by('-following_count').first().user
+    followed = Follow.objects.filter(user=reader).values('author')
+    stranger = User.objects.exclude(pk=reader.pk).exclude(
+        pk__in=followed
+    ).order_by('pk').first()
+    return {
+        'author': author,
+        'reader': reader,
+        'stranger': stranger,
+        'group': Group.objects.order_by('-posts_count').first(),
+        'post': Post.objects.order_by('-comments_count').first(),
+    }
+
+
+def scenarios(objects):
+    author = objects['author']
+    reader = objects['reader']
+    stranger = objects['stranger']
+    post = objects['post']
+
+    def unfollow():
+        Follow.objects.filter(user=reader, author=stranger).delete()
+
+    def follow():
+        Follow.objects.get_or_create(user=reader, author=stranger)
+
+    return [
+        Scenario('index', reverse('posts:index')),
+        Scenario('index_page_10', reverse('posts:index') + '?page=10'),
+        Scenario('group_posts', reverse(
+            'posts:group_list', args=[objects['group'].slug]
+        )),
+        Scenario('profile', reverse(
+            'posts:profile', args=[author.username]
+        )),
+        Scenario('post_detail', reverse(
+            'posts:post_detail', args=[post.pk]
+        )),
+        Scenario(
+            'follow_index', reverse('posts:follow_index'), login=True
+        ),
+        Scenario(
+            'post_create', reverse('posts:post_create'), method='post',
+            data={'text': 'Замер'}, login=True, status=302,
+        ),
+        Scenario(
+            'add_comment', reverse('posts:add_comment', args=[post.pk]),
+            method='post', data={'text': 'Замер'}, login=True,
+            status=302,
+        ),
+        Scenario(
+            'profile_follow',
+            reverse('posts:profile_follow', args=[stranger.username]),
+            login=True, prepare=unfollow, status=302,
+        ),
+        Scenario(
+            'profile_unfollow',
+            reverse('posts:profile_unfollow', args=[stranger.username]),
+            login=True, prepare=follow, status=302,
+        ),
+    ]
+
+
+def _request(client, scenario):
+    response = getattr(client, scenario.method)(
+        scenario.url, scenario.data or {}
+    )
+    if response.status_code != scenario.status:
+        raise AssertionError(
+            f'{scenario.name}: {scenario.url} вернул '
+            f'{response.status_code} вместо {scenario.status}'
+        )
+    return response
+
+
+def measure(client, scenario, requests=50, warmup=5, cold=False):
+    """Замер одного сценария; cold очищает кэш перед каждым запросом."""
+    timings = []
+    queries = []
+    for i in range(warmup + requests):
+        if scenario.prepare:
+            scenario.prepare()
+        if cold:
+            cache.clear()
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            _request(client, scenario)
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+    # tracemalloc заметно замедляет код, поэтому память меряем
+    # отдельным запросом вне замера времени.
+    if scenario.prepare:
+        scenario.prepare()
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        _request(client, scenario)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(requests=50, warmup=5, cold=False, warm=False, only=None,
+        log=None):
+    """Прогоняет все сценарии; возвращает {имя: метрики}.
+
+    warm оставляет включённым кэш целых страниц.
+    """
+    log = log or (lambda name, result: None)
+    objects = sample()
+    guest = Client()
+    member = Client()
+    member.force_login(objects['reader'])
+    cache.clear()
+    results = {}
+    page_cache = {} if warm else {'PAGE_CACHE_TIMEOUT': 0}
+    with override_settings(**page_cache):
+        for scenario in scenarios(objects):
+            if only and scenario.name not in only:
+                continue
+            client = member if scenario.login else guest
+            results[scenario.name] = measure(
+                client, scenario, requests, warmup, cold
+            )
+            log(scenario.name, results[scenario.name])
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Список регрессий относительно baseline.
+
+    Запросов к базе не должно стать больше; p95 и пик памяти
+    могут вырасти не более чем на threshold (с поправкой на шум).
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: запросов {current["queries"]} '
+                f'вместо {base["queries"]}'
+            )
+        limits = (
+            ('p95_ms', 'p95', 'мс', LATENCY_SLACK),
+            ('peak_kb', 'память', 'КиБ', MEMORY_SLACK),
+        )
+        for key, label, unit, slack in limits:
+            allowed = max(base[key] * (1 + threshold), base[key] + slack)
+            if current[key] > allowed:
+                regressions.append(
+                    f'{name}: {label} {current[key]} {unit} '
+                    f'при базовых {base[key]} {unit}'
+                )
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as results_file:
+        return json.load(results_file)['views']
+
+
+def dump(results, path, **meta):
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(
+            {'meta': meta, 'views': results}, results_file,
+            ensure_ascii=False, indent=2, sort_keys=True,
+        )
@@ -0,0 +1,121 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+FEED_GENERATION_KEY = 'posts:feed_generation'
+COMMENTS_GENERATION_KEY = 'posts:comments_generation:{}'
+FOLLOWS_GENERATION_KEY = 'posts:follows_generation'
+READER_FOLLOWS_GENERATION_KEY = 'posts:follows_generation:{}'
+SUGGESTIONS_GENERATION_KEY = 'posts:suggestions_generation'
+# Параметры запроса, от которых зависит страница ленты или поста;
+# остальные (метки рассылок и прочее) в версию не входят.
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def _initial_generation():
+    # Начинаем с метки времени, а не с единицы: если счётчик вытеснят
+    # из кэша, новое поколение не совпадёт со старыми фрагментами.
+    return int(time.time() * 1000)
+
+
+def generation(key):
+    return cache.get_or_set(key, _initial_generation, None)
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_generation(), None)
+
+
+def feed_generation():
+    """Текущее поколение лент; входит в ключи кэша фрагментов."""
+    return generation(FEED_GENERATION_KEY)
+
+
+def bump_feed_generation():
+    """Делает недействительными все закэшированные фрагменты лент."""
+    bump_generation(FEED_GENERATION_KEY)
+
+
+def comments_generation(post_id):
+    """Поколение комментариев поста: меняется при любой их записи."""
+    return generation(COMMENTS_GENERATION_KEY.format(post_id))
+
+
+def bump_comments_generation(post_id):
+    bump_generation(COMMENTS_GENERATION_KEY.format(post_id))
+
+
+def follows_generation():
+    """Поколение закэшированных подписок (posts.follows)."""
+    return generation(FOLLOWS_GENERATION_KEY)
+
+
+def bump_follows_generation():
+    """Сбрасывает подписки всех читателей после записи в обход сигналов."""
+    bump_generation(FOLLOWS_GENERATION_KEY)
+
+
+def reader_follows_generation(user_id):
+    """Поколение подписок одного читателя (posts.follows)."""
+    return generation(READER_FOLLOWS_GENERATION_KEY.format(user_id))
+
+
+def bump_reader_follows_generation(user_id):
+    bump_generation(READER_FOLLOWS_GENERATION_KEY.format(user_id))
+
+
+def suggestions_generation():
+    """Поколение рекомендаций; меняется после каждого build_suggestions."""
+    return generation(SUGGESTIONS_GENERATION_KEY)
+
+
+def bump_suggestions_generation():
+    bump_generation(SUGGESTIONS_GENERATION_KEY)
+
+
+def page_path(request):
+    """Путь страницы и только те параметры, что меняют её содержимое."""
+    params = urlencode([
+        (name, request.GET[name]) for name in PAGE_PARAMS
+        if name in request.GET
+    ])
+    return f'{request.path}?{params}' if params else request.path
+
+
+def feed_version(request, *args, **kwargs):
+    """Версия лент index, group_posts и profile: без запросов к базе."""
+    return f'{feed_generation()}|{page_path(request)}'
+
+
+def profile_version(request, *args, **kwargs):
+    """Версия профиля: лента и панель «Кого почитать» на нём."""
+    return f'{feed_version(request)}|{suggestions_generation()}'
+
+
+def post_version(request, post_id):
+    return '{}|{}|{}'.format(
+        feed_generation(), comments_generation(post_id), page_path(request),
+    )
+
+
+def etag(version):
+    """ETag страницы: версия данных и пользователь.
+
+    Пользователь входит в ключ, потому что шапка, кнопка подписки
+    и форма комментария у каждого свои.
+    """
+    def etag_func(request, *args, **kwargs):
+        user = request.user.pk if request.user.is_authenticated else 0
+        raw = f'{version(request, *args, **kwargs)}|{user}'
+        return hashlib.md5(raw.encode()).hexdigest()
+    return etag_func
+
+
+feed_etag = etag(feed_version)
+profile_etag = etag(profile_version)
+post_etag = etag(post_version)
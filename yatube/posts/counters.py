@@ -0,0 +1,127 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Сколько недостающих строк AuthorStats собирать в памяти за раз.
+BATCH_SIZE = 1000
+# id в одном запросе IN (...): старые SQLite принимают до 999 параметров.
+IN_CHUNK = 900
+
+
+def change(model, pk, delta, *fields):
+    """Атомарно сдвигает счётчики строки на delta одним UPDATE."""
+    if pk is None or not delta:
+        return
+    model.objects.filter(pk=pk).update(
+        **{field: F(field) + delta for field in fields}
+    )
+
+
+def change_author(user_id, delta, *fields):
+    # Если строки ещё нет (пользователь создан в обход сигналов),
+    # её с точными значениями заведёт get_author_stats или reconcile.
+    change(AuthorStats, user_id, delta, *fields)
+
+
+def change_authors(deltas, field):
+    """Сдвигает field у многих авторов сразу: deltas — {user_id: delta}.
+
+    Один UPDATE на каждое встретившееся значение delta (и на каждые
+    IN_CHUNK id), а не на каждого автора.
+    """
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        for start in range(0, len(pks), IN_CHUNK):
+            AuthorStats.objects.filter(
+                pk__in=pks[start:start + IN_CHUNK]
+            ).update(**{field: F(field) + delta})
+
+
+def edited_fields(form):
+    """Поля модели, которые правит форма.
+
+    Правку существующей записи сохраняем с update_fields из этого
+    списка: иначе save() вернёт в базу счётчики, прочитанные вместе
+    с записью, поверх атомарных UPDATE, сделанных за это время.
+    """
+    concrete = {field.name for field in form._meta.model._meta.concrete_fields}
+    return [name for name in form._meta.fields if name in concrete]
+
+
+def get_author_stats(user):
+    """Счётчики пользователя; отсутствующая строка создаётся на лету."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        reconcile_authors(User.objects.filter(pk=user.pk))
+        return AuthorStats.objects.get(pk=user.pk)
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def reconcile_authors(users=None, batch_size=BATCH_SIZE):
+    """Пересчитывает AuthorStats по фактическим данным.
+
+    Возвращает число исправленных строк.
+    """
+    if users is None:
+        users = User.objects.all()
+    missing = users.filter(stats__isnull=True).order_by('pk').values_list(
+        'pk', flat=True
+    )
+    last = 0
+    while True:
+        pks = list(missing.filter(pk__gt=last)[:batch_size])
+        if not pks:
+            break
+        # Размер одного INSERT bulk_create подбирает сам: явный
+        # batch_size в Django 2.2 не сверяется с лимитами SQLite.
+        AuthorStats.objects.bulk_create(
+            [AuthorStats(user_id=pk) for pk in pks], ignore_conflicts=True
+        )
+        last = pks[-1]
+    posts = _count(Post.objects.all(), 'author')
+    followers = _count(Follow.objects.all(), 'author')
+    following = _count(Follow.objects.all(), 'user')
+    return AuthorStats.objects.filter(user__in=users).exclude(
+        posts_count=posts,
+        followers_count=followers,
+        following_count=following,
+    ).update(
+        posts_count=posts,
+        followers_count=followers,
+        following_count=following,
+    )
+
+
+def reconcile_groups():
+    return Group.objects.exclude(
+        posts_count=_count(Post.objects.all(), 'group')
+    ).update(posts_count=_count(Post.objects.all(), 'group'))
+
+
+def reconcile_posts():
+    return Post.objects.exclude(
+        comments_count=_count(Comment.objects.all(), 'post')
+    ).update(comments_count=_count(Comment.objects.all(), 'post'))
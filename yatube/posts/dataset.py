@@ -0,0 +1,287 @@
+"""Синтетические данные для нагрузочных тестов.
+
+Словарь, группы и имена берутся из dump.json, объём задаётся
+параметрами. Строки пишутся пачками через insert_raw, поэтому
+память не растёт с размером набора.
+"""
+import io
+import json
+import os
+import random
+import re
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import AutoField, Max
+from django.utils import timezone
+
+from .counters import IN_CHUNK
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+DEFAULT_SEED_FILE = os.path.join(settings.BASE_DIR, 'dump.json')
+# Сколько разных текстов собирать заранее: склеивать слова для
+# каждого из миллионов постов дороже, чем сама вставка.
+TEXT_POOL = 10000
+
+
+class Seed:
+    """Словарь и справочники из фикстуры-образца."""
+
+    def __init__(self, path=DEFAULT_SEED_FILE):
+        with open(path, encoding='utf-8') as seed_file:
+            objects = json.load(seed_file)
+        texts = [
+            obj['fields']['text'] for obj in objects
+            if obj['model'] in ('posts.post', 'posts.comment')
+        ]
+        self.words = re.findall(r'\w+', ' '.join(texts)) or ['yatube']
+        self.names = [
+            (obj['fields']['first_name'], obj['fields']['last_name'])
+            for obj in objects if obj['model'] == 'auth.user'
+        ] or [('', '')]
+        self.groups = [
+            (obj['fields']['title'], obj['fields']['description'])
+            for obj in objects if obj['model'] == 'posts.group'
+        ] or [('Группа', '')]
+
+
+class PowerLaw:
+    """Выбор индекса 0..n-1 с вероятностью ~ 1 / (i + 1) ** alpha.
+
+    Обратная функция распределения непрерывного аналога: память
+    не зависит от n.
+    """
+
+    def __init__(self, n, alpha, rng):
+        if alpha == 1:
+            alpha = 1.0001
+        self.n = n
+        self.rng = rng
+        self.exponent = 1 - alpha
+        self.span = (n + 1) ** self.exponent - 1
+
+    def __call__(self):
+        point = (self.span * self.rng.random() + 1) ** (1 / self.exponent)
+        return min(int(point) - 1, self.n - 1)
+
+
+def insert_raw(model, objects, using=DEFAULT_DB_ALIAS,
+               ignore_conflicts=False):
+    """bulk_create, который пишет значения полей как есть.
+
+    Как raw-сохранение в loaddata: pre_save полей не вызывается, поэтому
+    auto_now и auto_now_add не подменяют даты. Сигналы не шлются.
+    """
+    ops = connections[using].ops
+    queryset = model._base_manager.using(using)
+    concrete = model._meta.concrete_fields
+    parts = (
+        ([obj for obj in objects if obj.pk is not None], concrete),
+        (
+            [obj for obj in objects if obj.pk is None],
+            [field for field in concrete if not isinstance(field, AutoField)],
+        ),
+    )
+    for part, fields in parts:
+        size = max(ops.bulk_batch_size(fields, part), 1)
+        for start in range(0, len(part), size):
+            queryset._insert(
+                part[start:start + size], fields=fields, raw=True,
+                ignore_conflicts=ignore_conflicts,
+            )
+
+
+def _batches(objects, batch_size):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, objects, batch_size, key=None, ignore_conflicts=False):
+    """Пишет объекты пачками; возвращает pk записанных строк.
+
+    Новые pk не обязаны идти подряд: SQLite AUTOINCREMENT не выдаёт
+    заново id удалённых строк, а дубли пропускаются. Поэтому строки
+    ищутся заново — по естественному ключу key, если он есть, иначе
+    как всё, что появилось после прежнего максимального pk.
+    """
+    pks = array('q')
+    last = model._base_manager.aggregate(last=Max('pk'))['last'] or 0
+    for batch in _batches(objects, batch_size):
+        with transaction.atomic():
+            insert_raw(model, batch, ignore_conflicts=ignore_conflicts)
+            if key is None:
+                continue
+            values = [getattr(obj, key) for obj in batch]
+            for start in range(0, len(values), IN_CHUNK):
+                pks.extend(model._base_manager.filter(**{
+                    f'{key}__in': values[start:start + IN_CHUNK]
+                }).order_by('pk').values_list('pk', flat=True))
+    if key is None:
+        pks.extend(
+            model._base_manager.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', flat=True).iterator()
+        )
+    return pks
+
+
+def _images(count, rng):
+    """Несколько картинок, общих для всех постов с изображением."""
+    from PIL import Image
+
+    names = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+        names.append(default_storage.save(
+            f'posts/synthetic_{i}.jpg', ContentFile(buffer.getvalue())
+        ))
+    return names
+
+
+class Generator:
+    def __init__(self, seed=None, rng_seed=0, batch_size=5000,
+                 days=365 * 3, alpha=1.1, log=None):
+        self.seed = seed or Seed()
+        self.rng = random.Random(rng_seed)
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.days = days
+        self.alpha = alpha
+        self.log = log or (lambda message: None)
+
+    def text(self, low, high):
+        words = self.rng.choices(
+            self.seed.words, k=self.rng.randint(low, high)
+        )
+        return ' '.join(words).capitalize() + '.'
+
+    def texts(self, low, high, pool=TEXT_POOL):
+        """Бесконечный поток текстов из заранее собранного набора."""
+        texts = [self.text(low, high) for _ in range(pool)]
+        while True:
+            yield self.rng.choice(texts)
+
+    def moment(self):
+        return self.now - timedelta(
+            seconds=self.rng.random() * self.days * 86400
+        )
+
+    def users(self, count, prefix='synth'):
+        # Пароль заведомо непригоден для входа: make_password слишком
+        # медленный для миллионов строк.
+        start = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+        def objects():
+            for i in range(start, start + count):
+                first_name, last_name = self.rng.choice(self.seed.names)
+                yield User(
+                    username=f'{prefix}{i}',
+                    password='!',
+                    first_name=first_name,
+                    last_name=last_name,
+                    date_joined=self.now,
+                )
+        return _insert(
+            User, objects(), self.batch_size, key='username',
+            ignore_conflicts=True,
+        )
+
+    def groups(self, count, prefix='synth'):
+        start = (Group.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+        def objects():
+            for i in range(start, start + count):
+                title, description = self.rng.choice(self.seed.groups)
+                yield Group(
+                    title=f'{title} {i}',
+                    slug=f'{prefix}-{i}',
+                    description=description,
+                )
+        return _insert(
+            Group, objects(), self.batch_size, key='slug',
+            ignore_conflicts=True,
+        )
+
+    def posts(self, count, user_ids, group_ids, image_share=0.0,
+              image_pool=20):
+        authors = PowerLaw(len(user_ids), self.alpha, self.rng)
+        images = []
+        if image_share:
+            images = _images(image_pool, self.rng)
+
+        texts = self.texts(5, 120)
+
+        def objects():
+            for _ in range(count):
+                group = None
+                if group_ids and self.rng.random() < 0.7:
+                    group = self.rng.choice(group_ids)
+                yield Post(
+                    text=next(texts),
+                    pub_date=self.moment(),
+                    author_id=user_ids[authors()],
+                    group_id=group,
+                    image=(
+                        self.rng.choice(images)
+                        if images and self.rng.random() < image_share
+                        else ''
+                    ),
+                )
+        return _insert(Post, objects(), self.batch_size)
+
+    def comments(self, count, user_ids, post_ids):
+        # Свежие и популярные посты комментируют чаще: pk постов растут
+        # вместе с датой загрузки, поэтому берём степенной закон с конца.
+        posts = PowerLaw(len(post_ids), self.alpha, self.rng)
+        texts = self.texts(1, 30)
+
+        def objects():
+            for _ in range(count):
+                yield Comment(
+                    post_id=post_ids[-1 - posts()],
+                    author_id=self.rng.choice(user_ids),
+                    text=next(texts),
+                    created=self.moment(),
+                )
+        return _insert(Comment, objects(), self.batch_size)
+
+    def follows(self, user_ids, mean):
+        """Граф подписок: популярность авторов — степенной закон,
+        число подписок у читателя — распределение Парето."""
+        authors = PowerLaw(len(user_ids), self.alpha, self.rng)
+        limit = max(1, len(user_ids) - 1)
+
+        def objects():
+            for user_id in user_ids:
+                count = min(
+                    limit, int(self.rng.paretovariate(1.5) * mean / 3)
+                )
+                followed = set()
+                for _ in range(count * 2):
+                    if len(followed) >= count:
+                        break
+                    author_id = user_ids[authors()]
+                    if author_id != user_id:
+                        followed.add(author_id)
+                for author_id in followed:
+                    yield Follow(
+                        user_id=user_id, author_id=author_id,
+                        created=self.now,
+                    )
+        return _insert(
+            Follow, objects(), self.batch_size, ignore_conflicts=True
+        )
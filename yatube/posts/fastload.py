@@ -0,0 +1,167 @@
+"""Потоковая загрузка фикстур в обход loaddata.
+
+Файл читается по частям (JSON-массив или NDJSON, в том числе .gz),
+объекты собираются по моделям и пишутся через insert_raw пачками,
+каждая в своей транзакции. Проверка внешних ключей отключается на
+время загрузки и выполняется один раз в конце.
+"""
+import gzip
+import json
+from collections import defaultdict
+
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .dataset import insert_raw
+
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 10000
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _skip_space(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Фикстура должна быть JSON-массивом')
+    position = 1
+    while True:
+        position = _skip_space(buffer, position)
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                obj, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект не поместился в буфер: дочитываем и пробуем снова.
+                pass
+            else:
+                yield obj
+                continue
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError('Неожиданный конец JSON-массива')
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_objects(path):
+    """Словари фикстуры из файла в формате JSON или NDJSON."""
+    with _open(path) as stream:
+        head = stream.read(1)
+        while head.isspace():
+            head = stream.read(1)
+        stream.seek(0)
+        if head == '[':
+            yield from iter_json_array(stream)
+        else:
+            yield from iter_ndjson(stream)
+
+
+def exclude(objects, labels):
+    """Отбрасывает объекты моделей из labels (app_label[.ModelName])."""
+    labels = {label.lower() for label in labels}
+    for obj in objects:
+        model = obj.get('model', '').lower()
+        if model in labels or model.split('.')[0] in labels:
+            continue
+        yield obj
+
+
+class Loader:
+    """Пишет десериализованные объекты пачками по batch_size.
+
+    Счётчик loaded — {модель: число строк}; сигналы не отправляются.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE,
+                 ignore_conflicts=False, log=None):
+        self.using = using
+        self.batch_size = batch_size
+        self.ignore_conflicts = ignore_conflicts
+        self.log = log or (lambda loaded: None)
+        self.pending = defaultdict(list)
+        self.relations = defaultdict(list)
+        self.size = 0
+        self.loaded = defaultdict(int)
+
+    def add(self, deserialized):
+        obj = deserialized.object
+        model = type(obj)
+        self.pending[model].append(obj)
+        for name, values in (deserialized.m2m_data or {}).items():
+            if not values:
+                continue
+            if obj.pk is None:
+                raise ValueError(
+                    f'{model._meta.label}: для связей {name} нужен pk'
+                )
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            self.relations[through].extend(
+                through(**{source: obj.pk, target: value})
+                for value in values
+            )
+        self.size += 1
+        if self.size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.size:
+            return
+        with transaction.atomic(using=self.using):
+            for pending in (self.pending, self.relations):
+                for model, objects in pending.items():
+                    # Даты из фикстуры пишем как есть, как это делает
+                    # raw-сохранение в loaddata.
+                    insert_raw(
+                        model, objects, using=self.using,
+                        ignore_conflicts=self.ignore_conflicts,
+                    )
+                    self.loaded[model] += len(objects)
+        self.pending.clear()
+        self.relations.clear()
+        self.size = 0
+        # При DEBUG = True журнал запросов держит тысячи огромных
+        # INSERT: без очистки память растёт с размером дампа.
+        connections[self.using].queries_log.clear()
+        self.log(self.loaded)
+
+    def load(self, objects):
+        """Загружает словари фикстуры; возвращает затронутые модели."""
+        connection = connections[self.using]
+        with connection.constraint_checks_disabled():
+            for deserialized in Deserializer(objects, using=self.using):
+                self.add(deserialized)
+            self.flush()
+        models = list(self.loaded)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in models]
+        )
+        reset = connection.ops.sequence_reset_sql(no_style(), models)
+        if reset:
+            with connection.cursor() as cursor:
+                for sql in reset:
+                    cursor.execute(sql)
+        return models
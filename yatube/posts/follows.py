@@ -0,0 +1,267 @@
+"""Множества подписок читателей в кэше.
+
+Для каждого читателя хранится отсортированный массив id авторов
+(array('q')): проверка подписки — двоичный поиск, лента подписок
+строится по author_id IN (...) без подзапроса к posts_follow.
+Подписка и отписка правят массив на месте, массовые загрузки
+сбрасывают все массивы сменой поколения. Если массив читателя уже
+правит другой запрос, читатель получает новое собственное поколение:
+запись, начатая по старому ключу, никому больше не видна.
+
+Здесь же запись подписок в обход сигналов: follow и unfollow — по
+одному запросу, import_pairs — тысячи подписок на транзакцию. Счётчики
+и ленты они обновляют в той же транзакции, кэши — после её коммита.
+"""
+import secrets
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import counters, timelines
+from .caching import (bump_feed_generation, bump_reader_follows_generation,
+                      follows_generation, reader_follows_generation)
+from .models import AuthorStats, Follow
+
+User = get_user_model()
+
+KEY = 'posts:following:{generation}:{user_id}:{reader_generation}'
+TIMEOUT = 60 * 60 * 24
+# Срок блокировки правки массива, если держатель не снял её сам.
+LOCK_TIMEOUT = 10
+# Длиннее список — и лента строится подзапросом: старые SQLite
+# не принимают больше 999 параметров в запросе.
+IN_LIMIT = 900
+IMPORT_BATCH_SIZE = 5000
+
+
+def _key(user_id):
+    return KEY.format(
+        generation=follows_generation(),
+        user_id=user_id,
+        reader_generation=reader_follows_generation(user_id),
+    )
+
+
+def _load(user_id):
+    return array('q', Follow.objects.filter(
+        user_id=user_id
+    ).order_by('author_id').values_list('author_id', flat=True))
+
+
+def following_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    key = _key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _load(user_id)
+        cache.set(key, ids, TIMEOUT)
+    return ids
+
+
+def is_following(user_id, author_id):
+    ids = following_ids(user_id)
+    index = bisect_left(ids, author_id)
+    return index < len(ids) and ids[index] == author_id
+
+
+def followed_posts(queryset, user_id):
+    """Посты из queryset от авторов, на которых подписан user_id."""
+    ids = following_ids(user_id)
+    if len(ids) > IN_LIMIT:
+        return queryset.followed_by(user_id)
+    return queryset.filter(author_id__in=list(ids))
+
+
+def followed_posts_count(user_id):
+    """Число постов в ленте подписок по счётчикам авторов."""
+    ids = following_ids(user_id)
+    if not ids:
+        return 0
+    if len(ids) > IN_LIMIT:
+        authors = AuthorStats.objects.filter(
+            pk__in=Follow.objects.filter(user_id=user_id).values('author')
+        )
+    else:
+        authors = AuthorStats.objects.filter(pk__in=list(ids))
+    return authors.aggregate(total=Sum('posts_count'))['total'] or 0
+
+
+def _update(user_id, author_id, follow):
+    key = _key(user_id)
+    lock_key = f'{key}:lock'
+    token = secrets.token_hex(8)
+    if not cache.add(lock_key, token, LOCK_TIMEOUT):
+        # Массив правит другой запрос, и его cache.set затёр бы наше
+        # изменение. Удалить ключ мало — держатель запишет его снова,
+        # поэтому меняем ключ: массив соберётся заново из базы.
+        bump_reader_follows_generation(user_id)
+        return
+    try:
+        ids = cache.get(key)
+        if ids is None:
+            return
+        index = bisect_left(ids, author_id)
+        present = index < len(ids) and ids[index] == author_id
+        if follow and not present:
+            ids.insert(index, author_id)
+        elif not follow and present:
+            del ids[index]
+        else:
+            return
+        cache.set(key, ids, TIMEOUT)
+    finally:
+        # Просроченную блокировку мог взять другой запрос.
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def add(user_id, author_id):
+    _update(user_id, author_id, True)
+
+
+def remove(user_id, author_id):
+    _update(user_id, author_id, False)
+
+
+def _execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(
+            table=connection.ops.quote_name(Follow._meta.db_table)
+        ), params)
+        return cursor.rowcount
+
+
+def _insert(pairs):
+    """Вставляет подписки pairs; возвращает те, что вставились.
+
+    Каждая пара — свой INSERT ... ON CONFLICT DO NOTHING: по rowcount
+    видно, создал ли подписку именно этот запрос, а не одновременный.
+    """
+    created = Follow._meta.get_field('created').get_db_prep_value(
+        timezone.now(), connection
+    )
+    sql = (
+        'INSERT INTO {table} (user_id, author_id, created) '
+        'VALUES (%s, %s, %s) ON CONFLICT DO NOTHING'
+    ).format(table=connection.ops.quote_name(Follow._meta.db_table))
+    inserted = set()
+    with connection.cursor() as cursor:
+        for user_id, author_id in pairs:
+            cursor.execute(sql, [user_id, author_id, created])
+            if cursor.rowcount:
+                inserted.add((user_id, author_id))
+    return inserted
+
+
+def _followed(pairs):
+    """Счётчики, ленты и кэши после записи новых подписок pairs.
+
+    Кэши правятся после коммита: при откате в них не останется
+    подписок, которых нет в базе.
+    """
+    counters.change_authors(
+        Counter(author_id for _, author_id in pairs), 'followers_count'
+    )
+    counters.change_authors(
+        Counter(user_id for user_id, _ in pairs), 'following_count'
+    )
+    if settings.FOLLOW_TIMELINES:
+        for user_id, author_id in pairs:
+            timelines.backfill(user_id, author_id)
+
+    def refresh():
+        if len(pairs) == 1:
+            add(*next(iter(pairs)))
+        else:
+            cache.delete_many({_key(user_id) for user_id, _ in pairs})
+        bump_feed_generation()
+
+    transaction.on_commit(refresh)
+
+
+@transaction.atomic
+def follow(user_id, author_id):
+    """Подписка одним INSERT; True, если её ещё не было.
+
+    Повторная или одновременная подписка не создаёт дубликатов и не
+    падает: конфликт с unique_follow просто игнорируется.
+    """
+    inserted = _insert([(user_id, author_id)])
+    if inserted:
+        _followed(inserted)
+    return bool(inserted)
+
+
+@transaction.atomic
+def unfollow(user_id, author_id):
+    """Отписка одним DELETE; False, если подписки и так не было."""
+    deleted = _execute(
+        'DELETE FROM {table} WHERE user_id = %s AND author_id = %s',
+        [user_id, author_id],
+    )
+    if deleted:
+        counters.change_author(author_id, -1, 'followers_count')
+        counters.change_author(user_id, -1, 'following_count')
+        if settings.FOLLOW_TIMELINES:
+            timelines.trim(user_id, author_id)
+
+        def refresh():
+            remove(user_id, author_id)
+            bump_feed_generation()
+
+        transaction.on_commit(refresh)
+    return bool(deleted)
+
+
+def _import_batch(pairs):
+    pairs = {(user_id, author_id) for user_id, author_id in pairs
+             if user_id != author_id}
+    user_ids = list({user_id for user_id, _ in pairs})
+    with transaction.atomic():
+        # Чтение отсекает большинство существующих подписок дёшево;
+        # созданные между чтением и вставкой отсеет ON CONFLICT.
+        existing = set()
+        for start in range(0, len(user_ids), IN_LIMIT):
+            existing.update(Follow.objects.filter(
+                user_id__in=user_ids[start:start + IN_LIMIT]
+            ).values_list('user_id', 'author_id'))
+        new = _insert(pairs - existing)
+        if new:
+            _followed(new)
+    return len(new)
+
+
+def import_pairs(pairs, batch_size=IMPORT_BATCH_SIZE):
+    """Создаёт подписки из пар (user_id, author_id) пачками.
+
+    Существующие подписки и подписки на себя пропускаются.
+    Возвращает число новых подписок.
+    """
+    total = 0
+    batch = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            total += _import_batch(batch)
+            batch = []
+    if batch:
+        total += _import_batch(batch)
+    return total
+
+
+def resolve(usernames):
+    """{username: id} для существующих пользователей из usernames."""
+    usernames = list(set(usernames))
+    ids = {}
+    for start in range(0, len(usernames), IN_LIMIT):
+        ids.update(User.objects.filter(
+            username__in=usernames[start:start + IN_LIMIT]
+        ).values_list('username', 'pk'))
+    return ids
@@ -1,6 +1,9 @@
 from django import forms
+from django.db import transaction
 
+from . import counters
 from .models import Comment, Post
+from .thumbnails import pregenerate
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +11,17 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def save(self, commit=True):
+        if commit and not self.instance._state.adding:
+            post = super().save(commit=False)
+            post.save(update_fields=counters.edited_fields(self))
+            self._save_m2m()
+        else:
+            post = super().save(commit)
+        if commit and 'image' in self.changed_data:
+            transaction.on_commit(lambda: pregenerate(post.image))
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,131 @@
+import os
+import platform
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from core.testing import isolated_caches
+from posts import benchmarks
+
+DEFAULT_BASELINE = os.path.join(
+    settings.BASE_DIR, 'benchmarks', 'baseline.json'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет представления posts на сгенерированном наборе данных '
+        'и сравнивает результат с базовой линией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=float, default=20)
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Отдавать страницы из кэша целых страниц',
+        )
+        parser.add_argument(
+            '--only', nargs='*', help='Замерить только эти сценарии',
+        )
+        parser.add_argument(
+            '--output', help='Куда сохранить результаты в JSON',
+        )
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument(
+            '--threshold', type=float,
+            default=benchmarks.DEFAULT_THRESHOLD,
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию',
+        )
+
+    def handle(self, *args, **options):
+        # Замеры идут на отдельной файловой базе, чтобы работали
+        # PRAGMA из SQLITE_PRAGMAS и не трогались рабочие данные.
+        # Кэш тоже свой: замеры очищают его и меняют поколения, а общий
+        # файл кэша читают воркеры сайта.
+        directory = tempfile.mkdtemp(prefix='yatube-bench-')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'bench.sqlite3'
+        )
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        setup_test_environment(debug=False)
+        cache_settings = override_settings(CACHES=isolated_caches(directory))
+        cache_settings.enable()
+        try:
+            call_command(
+                'generate_dataset',
+                users=options['users'],
+                groups=options['groups'],
+                posts=options['posts'],
+                comments=options['comments'],
+                follows=options['follows'],
+                stdout=self.stdout,
+            )
+            results = benchmarks.run(
+                requests=options['requests'],
+                warmup=options['warmup'],
+                cold=options['cold'],
+                warm=options['warm'],
+                only=options['only'],
+                log=self.report,
+            )
+        finally:
+            cache_settings.disable()
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+        meta = {
+            key: options[key] for key in (
+                'users', 'groups', 'posts', 'comments', 'follows',
+                'requests', 'warmup', 'cold', 'warm',
+            )
+        }
+        meta['python'] = platform.python_version()
+        if options['output']:
+            benchmarks.dump(results, options['output'], **meta)
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            benchmarks.dump(results, options['baseline'], **meta)
+            self.stdout.write(f'Базовая линия: {options["baseline"]}')
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write('Базовой линии нет, сравнивать не с чем')
+            return
+        regressions = benchmarks.compare(
+            results,
+            benchmarks.load(options['baseline']),
+            options['threshold'],
+        )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<18} p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'запросов {result["queries"]:>3}  '
+            f'память {result["peak_kb"]:>8.1f} КиБ'
+        )
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации «кого почитать» по графу подписок '
+        '(друзья друзей и совместные подписки)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int,
+            help='Рекомендаций на читателя (по умолчанию '
+                 'SUGGESTIONS_PER_USER)',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=0,
+            help='Процессов для подсчёта (нужен fork); 0 — считать '
+                 'в текущем',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=suggestions.BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        start = time.monotonic()
+        count = suggestions.build(
+            k=options['top'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            log=self.progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации для {count} читателей '
+            f'за {time.monotonic() - start:.1f} с'
+        ))
+
+    def progress(self, done):
+        if self.verbosity > 1:
+            self.stdout.write(f'... {done}')
@@ -0,0 +1,114 @@
+import re
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.models import Comment, Group, Post, TimelineEntry
+from posts.paginators import KeysetPaginator
+
+User = get_user_model()
+
+# Ленты, которым разрешена сортировка во временном B-дереве: лента
+# подписок без FOLLOW_TIMELINES сливает выборки нескольких авторов,
+# и общего индекса для неё нет. Каждая выборка при этом берётся по
+# индексу автора, а с курсором — диапазоном от курсора.
+SORTED_FEEDS = ('follow_index',)
+
+# Ограничение поиска в плане: «(group_id=? AND pub_date<?)».
+CONSTRAINT = re.compile(r'\((.*)\)$')
+
+
+def feed_queries(user_id, group_id, post_id):
+    """Запросы лент в порядке страниц сайта.
+
+    Для каждой ленты — (лента, запрос страницы, модель, курсорный ли
+    это запрос): первая страница и страницы после и до курсора.
+    """
+    feeds = {
+        'index': Post.objects.feed(),
+        'group_posts': Post.objects.feed().filter(group_id=group_id),
+        'profile': Post.objects.feed().filter(author_id=user_id),
+        'follow_index': Post.objects.feed().followed_by(user_id),
+        'follow_index (timeline)': TimelineEntry.objects.filter(
+            user_id=user_id
+        ).select_related('post__author', 'post__group'),
+        'post_detail comments': Comment.objects.filter(
+            post_id=post_id
+        ).thread(),
+    }
+    for name, queryset in feeds.items():
+        yield name, 'page', queryset[:settings.QUANTITY], False
+        date_field = (
+            'created' if queryset.model is Comment else 'pub_date'
+        )
+        paginator = KeysetPaginator(queryset, settings.QUANTITY, date_field)
+        # Пустая лента тоже проверяется с курсором: план от данных
+        # не зависит.
+        sample = queryset.order_by(f'-{date_field}', '-pk').first() or (
+            SimpleNamespace(**{date_field: timezone.now(), 'pk': 0})
+        )
+        cursor = paginator.encode_cursor(sample)
+        for direction in ('after', 'before'):
+            yield name, direction, paginator.cursor_queryset(
+                **{direction: cursor}
+            ), True
+
+
+def plan_problems(name, plan, table, keyset):
+    """Шаги плана, с которыми лента замедляется с ростом таблицы.
+
+    Любой ленте нельзя читать таблицу целиком и сортировать выборку
+    (кроме SORTED_FEEDS). Курсорной странице нельзя и идти по индексу
+    от начала ленты: поиск по её таблице должен начинаться с курсора,
+    то есть иметь в ограничении диапазон, а не только равенства.
+    """
+    problems = []
+    for line in plan.splitlines():
+        step = line.split(maxsplit=3)[-1]
+        if step.startswith('SCAN') and (keyset or 'INDEX' not in step):
+            problems.append(step)
+        elif 'TEMP B-TREE' in step and name not in SORTED_FEEDS:
+            problems.append(step)
+        elif keyset and step.startswith(f'SEARCH {table} '):
+            constraint = CONSTRAINT.search(step)
+            if not constraint or not re.search('[<>]', constraint[1]):
+                problems.append(step)
+    return problems
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает EXPLAIN QUERY PLAN запросов лент и проверяет, что они '
+        'не читают таблицу целиком, а курсоры начинают диапазон индекса'
+    )
+
+    def handle(self, *args, **options):
+        if 'sqlite' not in settings.DATABASES['default']['ENGINE']:
+            raise CommandError('Команда разбирает планы только для SQLite')
+        user = User.objects.order_by('pk').first()
+        group = Group.objects.order_by('pk').first()
+        post = Post.objects.order_by('pk').first()
+        problems = []
+        for name, page, queryset, keyset in feed_queries(
+            user.pk if user else 1,
+            group.pk if group else 1,
+            post.pk if post else 1,
+        ):
+            plan = queryset.explain()
+            self.stdout.write(f'== {name}: {page}\n{plan}\n')
+            problems.extend(
+                f'{name}: {page}: {step}' for step in plan_problems(
+                    name, plan, queryset.model._meta.db_table, keyset
+                )
+            )
+        if problems:
+            raise CommandError(
+                'Запросы замедляются с ростом таблицы:\n'
+                + '\n'.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Ленты читают таблицы по индексам, курсоры — диапазоном'
+        ))
@@ -0,0 +1,46 @@
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import export_name, iter_chunks, parse_since
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в NDJSON; '
+        'с --since — только изменения после даты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-o', '--output',
+            help='Файл выгрузки; "-" — стандартный вывод. По умолчанию '
+                 'имя строится по дате и формату',
+        )
+        parser.add_argument(
+            '--since', help='Дата или дата-время ISO 8601',
+        )
+        parser.add_argument('--gzip', action='store_true')
+
+    def handle(self, *args, **options):
+        since = options['since']
+        try:
+            since = parse_since(since) if since else None
+        except ValueError as e:
+            raise CommandError(e)
+        output = options['output']
+        compress = options['gzip'] or bool(
+            output and output.endswith('.gz')
+        )
+        if output == '-':
+            if compress:
+                raise CommandError('gzip нельзя писать в стандартный вывод')
+            for chunk in iter_chunks(since):
+                self.stdout.write(chunk, ending='')
+            return
+        output = output or export_name(since, compress)
+        opener = gzip.open if compress else open
+        with opener(output, 'wt', encoding='utf-8') as export_file:
+            for chunk in iter_chunks(since):
+                export_file.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Выгрузка: {output}'))
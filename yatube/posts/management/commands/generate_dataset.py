@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import counters, timelines
+from posts.caching import bump_feed_generation, bump_follows_generation
+from posts.dataset import DEFAULT_SEED_FILE, Generator, Seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует пользователей, группы, посты, комментарии и подписки '
+        'по образцу dump.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок на пользователя',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1',
+        )
+        parser.add_argument('--seed-file', default=DEFAULT_SEED_FILE)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synth')
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            seed=Seed(options['seed_file']),
+            rng_seed=options['random_seed'],
+            batch_size=options['batch_size'],
+        )
+        steps = [
+            ('users', lambda: generator.users(
+                options['users'], options['prefix']
+            )),
+            ('groups', lambda: generator.groups(
+                options['groups'], options['prefix']
+            )),
+            ('posts', lambda: generator.posts(
+                options['posts'], created['users'], created['groups'],
+                options['images'],
+            )),
+            ('comments', lambda: generator.comments(
+                options['comments'], created['users'], created['posts'],
+            )),
+            ('follows', lambda: generator.follows(
+                created['users'], options['follows']
+            )),
+        ]
+        created = {}
+        for name, step in steps:
+            start = time.monotonic()
+            created[name] = step()
+            self.stdout.write(
+                f'{name}: {len(created[name])} '
+                f'за {time.monotonic() - start:.1f} с'
+            )
+        # bulk_create не шлёт сигналов: счётчики, ленты подписок
+        # и кэш лент приводим в порядок отдельно.
+        counters.reconcile_authors()
+        counters.reconcile_groups()
+        counters.reconcile_posts()
+        if settings.FOLLOW_TIMELINES:
+            timelines.rebuild(list(created['users']))
+        bump_feed_generation()
+        bump_follows_generation()
+        self.stdout.write(self.style.SUCCESS('Готово'))
@@ -0,0 +1,62 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import follows
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует подписки из CSV «подписчик,автор» (имена '
+        'пользователей) пачками с пропуском уже существующих'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV-файл или '-' для stdin")
+        parser.add_argument(
+            '--batch-size', type=int, default=follows.IMPORT_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        if options['path'] == '-':
+            self.run(sys.stdin, options)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as stream:
+                    self.run(stream, options)
+            except OSError as e:
+                raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f'Новых подписок: {self.followed}, '
+            f'строк с неизвестными именами: {self.unknown} '
+            f'за {time.monotonic() - start:.1f} с'
+        ))
+
+    def run(self, stream, options):
+        self.followed = self.unknown = 0
+        rows = []
+        for row in csv.reader(stream):
+            if not row:
+                continue
+            if len(row) != 2:
+                raise CommandError(f'Ожидались два имени, получено: {row}')
+            rows.append(row)
+            if len(rows) >= options['batch_size']:
+                self.import_rows(rows, options)
+                rows = []
+        if rows:
+            self.import_rows(rows, options)
+
+    def import_rows(self, rows, options):
+        ids = follows.resolve(name for row in rows for name in row)
+        pairs = [
+            (ids[user], ids[author]) for user, author in rows
+            if user in ids and author in ids
+        ]
+        self.unknown += len(rows) - len(pairs)
+        self.followed += follows.import_pairs(
+            pairs, batch_size=options['batch_size']
+        )
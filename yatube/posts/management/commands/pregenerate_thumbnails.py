@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры для картинок всех постов'
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        )
+        count = 0
+        for name in images.iterator():
+            for geometry, thumbnail_options in settings.POST_THUMBNAILS:
+                # Команда и так работает в фоне — пул ей не нужен
+                thumbnails.generate(name, geometry, dict(thumbnail_options))
+            count += 1
+        self.stdout.write(f'Обработано картинок: {count}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов (FTS5)'
+
+    def handle(self, *args, **options):
+        search.ensure_schema()
+        search.rebuild()
+        self.stdout.write('Поисковый индекс перестроен')
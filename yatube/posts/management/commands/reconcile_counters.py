@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики постов и подписок'
+
+    def handle(self, *args, **options):
+        authors = counters.reconcile_authors()
+        groups = counters.reconcile_groups()
+        posts = counters.reconcile_posts()
+        self.stdout.write(
+            f'Исправлено: авторов {authors}, групп {groups}, постов {posts}'
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+def clear_created(apps, schema_editor):
+    # AddField с auto_now_add проставляет существующим строкам время
+    # миграции, и первая выгрузка --since после неё отдала бы все
+    # старые подписки. Настоящей даты у них нет.
+    Follow = apps.get_model('posts', 'Follow')
+    Follow.objects.update(created=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True, verbose_name='Дата подписки'),
+        ),
+        migrations.RunPython(clear_created, migrations.RunPython.noop),
+    ]
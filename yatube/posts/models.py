@@ -7,6 +7,9 @@ class Group(models.Model):
     title = models.CharField('Название группы', max_length=200)
     slug = models.SlugField('Уникальный URL', unique=True)
     description = models.TextField('Описание группы')
+    posts_count = models.PositiveIntegerField(
+        'Число постов', default=0, editable=False
+    )
 
     def __str__(self):
         return self.title
@@ -15,6 +18,22 @@ class Group(models.Model):
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для карточек ленты: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(
+            'id', 'text', 'pub_date', 'image', 'author', 'group',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__title', 'group__slug',
+        )
+
+    def followed_by(self, user):
+        """Посты авторов, на которых подписан user."""
+        return self.filter(
+            author__in=Follow.objects.filter(user=user).values('author')
+        )
+
+
 class Post(models.Model):
     text = models.TextField('Текст поста')
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
@@ -37,16 +56,42 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
 
+class CommentQuerySet(models.QuerySet):
+    def thread(self):
+        """Комментарии для страницы поста: автор тем же запросом."""
+        return self.select_related('author').only(
+            'id', 'text', 'created', 'post', 'author', 'author__username',
+        )
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -63,10 +108,18 @@ class Comment(models.Model):
     text = models.TextField('Текст комментария')
     created = models.DateTimeField('Дата комментария', auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -85,6 +138,12 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+    # Для выгрузки изменений (posts.export); подпискам, сделанным до
+    # появления поля, миграция 0012 оставляет NULL, и в выгрузку
+    # --since они не попадают.
+    created = models.DateTimeField(
+        'Дата подписки', auto_now_add=True, null=True
+    )
 
     class Meta:
         verbose_name = 'Подписка'
@@ -92,3 +151,106 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=['author', 'user'], name='unique_follow'),
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счётчики пользователя, поддерживаемые при записи (posts.counters)."""
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+    def __str__(self) -> str:
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок читателя."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    # Автор и дата скопированы из поста, чтобы отписка и чтение ленты
+    # обходились индексами этой таблицы без соединения с posts_post.
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-id']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+
+
+class Suggestion(models.Model):
+    """Автор, которого стоит предложить читателю (posts.suggestions)."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+        related_name='suggestions'
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    score = models.FloatField('Оценка')
+    rank = models.PositiveSmallIntegerField('Место')
+
+    class Meta:
+        ordering = ['user', 'rank']
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'rank'], name='unique_suggestion_rank'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} → {self.author}'
@@ -0,0 +1,175 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class KeysetPage(Page):
+    """Страница ленты, выбранная по курсору, а не по номеру."""
+
+    def __init__(self, object_list, paginator, previous_cursor=None,
+                 next_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<Keyset page %s..%s>' % (
+            self.previous_cursor, self.next_cursor
+        )
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(Paginator):
+    """Пагинация по ключу (date_field, pk) от новых записей к старым.
+
+    Не выполняет COUNT(*) и OFFSET: каждая страница — это выборка
+    per_page + 1 строк после (или до) курсора, поэтому глубокие
+    страницы стоят столько же, сколько первая.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+
+    def cursor_value(self, obj):
+        """Строковое значение ключа сортировки для курсора."""
+        return getattr(obj, self.date_field).isoformat()
+
+    def parse_cursor_value(self, value):
+        return parse_datetime(value)
+
+    def encode_cursor(self, obj):
+        raw = f'{self.cursor_value(obj)}|{obj.pk}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (значение ключа, pk); для испорченного курсора None."""
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            value, pk = raw.rsplit('|', 1)
+            value = self.parse_cursor_value(value)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if value is None:
+            return None
+        return value, pk
+
+    def _boundary(self, key, older):
+        date, pk = key
+        lookup = 'lt' if older else 'gt'
+        # С одним OR SQLite не начинает диапазон индекса с курсора и
+        # идёт по индексу от начала ленты; нестрогая граница по дате
+        # даёт ему диапазон (pub_date<=?), OR лишь отсекает совпадения.
+        return Q(**{f'{self.date_field}__{lookup}e': date}) & (
+            Q(**{f'{self.date_field}__{lookup}': date})
+            | Q(**{self.date_field: date, f'pk__{lookup}': pk})
+        )
+
+    def cursor_queryset(self, after=None, before=None):
+        """Запрос одной страницы (per_page + 1 строк) для курсора."""
+        before_key = self.decode_cursor(before)
+        if before_key is not None:
+            return self.object_list.filter(
+                self._boundary(before_key, False)
+            ).order_by(self.date_field, 'pk')[:self.per_page + 1]
+        queryset = self.object_list.order_by(f'-{self.date_field}', '-pk')
+        after_key = self.decode_cursor(after)
+        if after_key is not None:
+            queryset = queryset.filter(self._boundary(after_key, True))
+        return queryset[:self.per_page + 1]
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или перед before.
+
+        Без курсора (или с испорченным курсором) отдаёт первую страницу.
+        """
+        rows = list(self.cursor_queryset(after, before))
+        if self.decode_cursor(before) is not None:
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = self.decode_cursor(after) is not None
+        if not rows:
+            return KeysetPage(rows, self)
+        return KeysetPage(
+            rows,
+            self,
+            previous_cursor=(
+                self.encode_cursor(rows[0])
+                if has_previous else None
+            ),
+            next_cursor=(
+                self.encode_cursor(rows[-1])
+                if has_next else None
+            ),
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который на больших списках не выполняет COUNT(*).
+
+    estimate — число или функция без аргументов, дающая примерный
+    размер списка (поддерживаемый счётчик, статистика таблицы) или
+    None, если оценки нет. Пока оценка меньше threshold, count точный;
+    дальше count — оценка (estimated = True), а страниц не больше
+    max_pages: до глубоких страниц добираются курсорами.
+
+    На маленьких списках к точному COUNT(*) добавляется запрос оценки;
+    table_estimate кэширует её, так что лишний запрос бывает не чаще
+    раза в ESTIMATE_TIMEOUT.
+    """
+
+    def __init__(self, object_list, per_page, estimate=None,
+                 threshold=None, max_pages=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.estimate = estimate
+        self.threshold = (
+            settings.ESTIMATED_COUNT_THRESHOLD
+            if threshold is None else threshold
+        )
+        self.max_pages = (
+            settings.ESTIMATED_MAX_PAGES if max_pages is None else max_pages
+        )
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate() if callable(self.estimate) else (
+            self.estimate
+        )
+        if estimate is None or estimate < self.threshold:
+            return Paginator.count.func(self)
+        self.estimated = True
+        return estimate
+
+    @cached_property
+    def num_pages(self):
+        num_pages = Paginator.num_pages.func(self)
+        if self.estimated:
+            return min(num_pages, self.max_pages)
+        return num_pages
+
+    def page(self, number):
+        page = super().page(number)
+        if self.estimated and len(page.object_list) < self.per_page:
+            # Оценка оказалась завышенной: дальше страниц нет.
+            self.num_pages = page.number
+        return page
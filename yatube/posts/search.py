@@ -0,0 +1,154 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginators import KeysetPaginator
+
+FTS_TABLE = 'posts_post_fts'
+TRIGGERS = {
+    'posts_post_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+    'posts_post_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END
+    """,
+    'posts_post_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE} (rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+}
+# Маркеры совпадений в snippet(): текст поста экранируется целиком,
+# а уже потом маркеры заменяются на <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def ensure_schema(using=connection):
+    """Создаёт FTS5-индекс постов и триггеры, если их нет.
+
+    Пересоздание posts_post в миграциях SQLite теряет триггеры;
+    в этом случае индекс заодно перестраивается.
+    """
+    if using.vendor != 'sqlite':
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+            " AND name IN (%s)" % ', '.join(['%s'] * (len(TRIGGERS) + 1)),
+            [FTS_TABLE, *TRIGGERS],
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing == {FTS_TABLE, *TRIGGERS}:
+            return
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "text, content='posts_post', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+    rebuild(using)
+
+
+def rebuild(using=connection):
+    """Перестраивает FTS5-индекс по текущему содержимому posts_post."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"
+        )
+
+
+def match_query(text):
+    """Переводит пользовательский ввод в безопасный запрос MATCH.
+
+    Каждое слово берётся в кавычки, последнее ищется как префикс.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def filter_posts(queryset, text):
+    """Оставляет в queryset только посты, подходящие под запрос."""
+    query = match_query(text)
+    if not query:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [query],
+    ))
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+class SearchPaginator(KeysetPaginator):
+    """Выдача поиска по релевантности (bm25) с курсорами (rank, id)."""
+
+    def __init__(self, text, per_page):
+        super().__init__(Post.objects.feed(), per_page)
+        self.query = match_query(text)
+
+    def cursor_value(self, obj):
+        return repr(obj.search_rank)
+
+    def parse_cursor_value(self, value):
+        return float(value)
+
+    def cursor_queryset(self, after=None, before=None):
+        if not self.query:
+            return []
+        # rank в FTS5 — bm25(), чем меньше, тем релевантнее
+        before_key = self.decode_cursor(before)
+        after_key = self.decode_cursor(after)
+        condition, params, order = '', [], 'ASC'
+        if before_key is not None:
+            condition = 'AND (rank < %s OR (rank = %s AND rowid < %s))'
+            params = [before_key[0], before_key[0], before_key[1]]
+            order = 'DESC'
+        elif after_key is not None:
+            condition = 'AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params = [after_key[0], after_key[0], after_key[1]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, rank, snippet({FTS_TABLE}, 0, %s, %s, '
+                f"'…', 16) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f'{condition} ORDER BY rank {order}, rowid {order} LIMIT %s',
+                [MARK_START, MARK_END, self.query, *params,
+                 self.per_page + 1],
+            )
+            rows = cursor.fetchall()
+        posts = self.object_list.in_bulk([row[0] for row in rows])
+        results = []
+        for pk, rank, snippet in rows:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.search_rank = rank
+            post.snippet = highlight(snippet)
+            results.append(post)
+        return results
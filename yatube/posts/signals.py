@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import counters, follows, timelines
+from .caching import bump_comments_generation, bump_feed_generation
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    instance._saved_group_id = None
+    if instance.pk is not None and not raw:
+        instance._saved_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.change_author(instance.author_id, 1, 'posts_count')
+        counters.change(Group, instance.group_id, 1, 'posts_count')
+    elif instance._saved_group_id != instance.group_id:
+        counters.change(Group, instance._saved_group_id, -1, 'posts_count')
+        counters.change(Group, instance.group_id, 1, 'posts_count')
+
+
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, -1, 'posts_count')
+    counters.change(Group, instance.group_id, -1, 'posts_count')
+
+
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change(Post, instance.post_id, 1, 'comments_count')
+
+
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change(Post, instance.post_id, -1, 'comments_count')
+
+
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_author(instance.author_id, 1, 'followers_count')
+        counters.change_author(instance.user_id, 1, 'following_count')
+
+
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_author(instance.author_id, -1, 'followers_count')
+    counters.change_author(instance.user_id, -1, 'following_count')
+
+
+def fan_out_post(sender, instance, created, **kwargs):
+    if created and settings.FOLLOW_TIMELINES:
+        timelines.fan_out_post(instance)
+
+
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created and settings.FOLLOW_TIMELINES:
+        timelines.backfill(instance.user_id, instance.author_id)
+
+
+def trim_timeline(sender, instance, **kwargs):
+    if settings.FOLLOW_TIMELINES:
+        timelines.trim(instance.user_id, instance.author_id)
+
+
+def remember_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.add(instance.user_id, instance.author_id)
+
+
+def forget_follow(sender, instance, **kwargs):
+    follows.remove(instance.user_id, instance.author_id)
+
+
+def invalidate_comments(sender, instance, **kwargs):
+    bump_comments_generation(instance.post_id)
+
+
+def invalidate_feeds(sender, update_fields=None, **kwargs):
+    # Вход пользователя обновляет только last_login — ленты не меняются.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_feed_generation()
+
+
+post_save.connect(
+    create_author_stats, sender=User, dispatch_uid='counters_user'
+)
+pre_save.connect(remember_post_group, sender=Post, dispatch_uid='counters_pre')
+post_save.connect(count_saved_post, sender=Post, dispatch_uid='counters_post')
+post_delete.connect(
+    count_deleted_post, sender=Post, dispatch_uid='counters_delete_post'
+)
+post_save.connect(count_comment, sender=Comment, dispatch_uid='counters')
+post_delete.connect(
+    count_deleted_comment, sender=Comment, dispatch_uid='counters'
+)
+post_save.connect(count_follow, sender=Follow, dispatch_uid='counters')
+post_delete.connect(
+    count_deleted_follow, sender=Follow, dispatch_uid='counters'
+)
+
+# Ленты подписок обновляются раньше, чем сбрасывается кэш, — иначе
+# между сбросом и заполнением кто-то успеет закэшировать старую ленту.
+post_save.connect(fan_out_post, sender=Post, dispatch_uid='timeline_post')
+post_save.connect(
+    backfill_timeline, sender=Follow, dispatch_uid='timeline_follow'
+)
+post_delete.connect(
+    trim_timeline, sender=Follow, dispatch_uid='timeline_unfollow'
+)
+
+post_save.connect(remember_follow, sender=Follow, dispatch_uid='follows')
+post_delete.connect(forget_follow, sender=Follow, dispatch_uid='follows')
+
+post_save.connect(
+    invalidate_comments, sender=Comment, dispatch_uid='comments_save'
+)
+post_delete.connect(
+    invalidate_comments, sender=Comment, dispatch_uid='comments_delete'
+)
+
+for model in (Post, Group, User, Follow):
+    post_save.connect(
+        invalidate_feeds,
+        sender=model,
+        dispatch_uid=f'feeds_save_{model.__name__}'
+    )
+    post_delete.connect(
+        invalidate_feeds,
+        sender=model,
+        dispatch_uid=f'feeds_delete_{model.__name__}'
+    )
@@ -0,0 +1,224 @@
+"""Рекомендации «кого почитать» по графу подписок.
+
+Граф целиком загружается в массивы в формате CSR: подписки читателя u —
+following.indices[following.indptr[u]:following.indptr[u + 1]], его
+подписчики — то же в followers. Кандидаты для читателя набирают очки
+двумя путями:
+
+* друзья друзей — на кого подписаны авторы, которых он читает;
+* совместные подписки — на кого ещё подписаны читатели его авторов
+  (вклад такого читателя делится на число его подписок).
+
+Лучшие TOP_K кандидатов пишутся в posts.Suggestion. Читатели
+обсчитываются пачками в отдельных процессах; граф достаётся им при
+fork без копирования.
+"""
+import heapq
+import multiprocessing
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+
+from . import follows
+from .caching import bump_suggestions_generation, suggestions_generation
+from .models import Follow, Suggestion
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+FRIEND_WEIGHT = 1.0
+CO_FOLLOW_WEIGHT = 0.5
+# Сколько подписчиков автора и подписок каждого из них смотреть для
+# совместных подписок: у популярных авторов их тысячи.
+FANOUT = 100
+KEY = 'posts:suggestions:{generation}:{user_id}'
+TIMEOUT = 60 * 60
+
+
+class Adjacency:
+    """Списки смежности в формате CSR."""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    def __getitem__(self, node):
+        if node + 1 >= len(self.indptr):
+            return self.indices[0:0]
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def degree(self, node):
+        return len(self[node])
+
+    def transpose(self):
+        size = len(self.indptr) - 1
+        counts = array('q', [0]) * (size + 1)
+        for target in self.indices:
+            counts[target + 1] += 1
+        for node in range(size):
+            counts[node + 1] += counts[node]
+        indptr = array('q', counts)
+        indices = array('q', [0]) * len(self.indices)
+        for source in range(size):
+            for target in self[source]:
+                indices[counts[target]] = source
+                counts[target] += 1
+        return Adjacency(indptr, indices)
+
+
+class Graph:
+    def __init__(self, following):
+        self.following = following
+        self.followers = following.transpose()
+
+    def readers(self):
+        """id всех, у кого есть хотя бы одна подписка."""
+        indptr = self.following.indptr
+        return [
+            node for node in range(len(indptr) - 1)
+            if indptr[node + 1] > indptr[node]
+        ]
+
+
+def load_graph():
+    """Читает posts_follow одним проходом по (user_id, author_id)."""
+    size = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+    indptr = array('q', [0]) * (size + 1)
+    indices = array('q')
+    edges = Follow.objects.order_by('user_id', 'author_id').values_list(
+        'user_id', 'author_id'
+    )
+    for user_id, author_id in edges.iterator(chunk_size=10000):
+        indptr[user_id + 1] += 1
+        indices.append(author_id)
+    for node in range(size):
+        indptr[node + 1] += indptr[node]
+    return Graph(Adjacency(indptr, indices))
+
+
+def recommend(graph, user_id, k):
+    """До k пар (автор, очки) для читателя, лучшие первыми."""
+    following = graph.following[user_id]
+    scores = defaultdict(float)
+    # Сколько общих авторов у читателя с каждым соседом: соседей
+    # собираем заранее, чтобы обойти подписки каждого один раз.
+    neighbours = defaultdict(int)
+    for author in following:
+        for candidate in graph.following[author]:
+            scores[candidate] += FRIEND_WEIGHT
+        for reader in graph.followers[author][:FANOUT]:
+            neighbours[reader] += 1
+    neighbours.pop(user_id, None)
+    for reader, shared in neighbours.items():
+        authors = graph.following[reader]
+        weight = CO_FOLLOW_WEIGHT * shared / len(authors)
+        for candidate in authors[:FANOUT]:
+            scores[candidate] += weight
+    scores.pop(user_id, None)
+    for author in following:
+        scores.pop(author, None)
+    return heapq.nlargest(
+        k, scores.items(), key=lambda item: (item[1], -item[0])
+    )
+
+
+_graph = None
+
+
+def _init_worker(graph):
+    global _graph
+    _graph = graph
+
+
+def _recommend_batch(args):
+    user_ids, k = args
+    return [(user_id, recommend(_graph, user_id, k)) for user_id in user_ids]
+
+
+def _save(batch):
+    with transaction.atomic():
+        Suggestion.objects.filter(
+            user_id__in=[user_id for user_id, _ in batch]
+        ).delete()
+        Suggestion.objects.bulk_create(
+            Suggestion(user_id=user_id, author_id=author_id,
+                       score=score, rank=rank)
+            for user_id, authors in batch
+            for rank, (author_id, score) in enumerate(authors)
+        )
+
+
+def build(k=None, workers=0, batch_size=BATCH_SIZE, log=None):
+    """Пересчитывает рекомендации всех читателей.
+
+    workers — число процессов для подсчёта (0 — в текущем). Без fork
+    (Windows) считается в текущем процессе: граф пришлось бы копировать
+    в каждый воркер.
+    Возвращает число обсчитанных читателей.
+    """
+    k = k or settings.SUGGESTIONS_PER_USER
+    log = log or (lambda done: None)
+    graph = load_graph()
+    readers = graph.readers()
+    tasks = (
+        (readers[start:start + batch_size], k)
+        for start in range(0, len(readers), batch_size)
+    )
+    pool = None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        workers = 0
+    if workers:
+        pool = multiprocessing.get_context('fork').Pool(
+            workers, initializer=_init_worker, initargs=(graph,)
+        )
+        results = pool.imap_unordered(_recommend_batch, tasks)
+    else:
+        _init_worker(graph)
+        results = map(_recommend_batch, tasks)
+    done = 0
+    try:
+        for batch in results:
+            _save(batch)
+            done += len(batch)
+            log(done)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    # Читатели, отписавшиеся от всех, остаются без рекомендаций.
+    stale = set(
+        Suggestion.objects.values_list('user_id', flat=True).distinct()
+    ).difference(readers)
+    stale = list(stale)
+    for start in range(0, len(stale), batch_size):
+        Suggestion.objects.filter(
+            user_id__in=stale[start:start + batch_size]
+        ).delete()
+    bump_suggestions_generation()
+    return done
+
+
+def for_user(user_id, limit=None):
+    """Рекомендованные авторы без тех, на кого читатель уже подписан."""
+    limit = limit or settings.SUGGESTIONS_SHOWN
+    key = KEY.format(generation=suggestions_generation(), user_id=user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = [
+            suggestion.author for suggestion in Suggestion.objects.filter(
+                user_id=user_id
+            ).select_related('author').only(
+                'author', 'author__username',
+                'author__first_name', 'author__last_name',
+            )
+        ]
+        cache.set(key, authors, TIMEOUT)
+    return [
+        author for author in authors
+        if not follows.is_following(user_id, author.pk)
+    ][:limit]
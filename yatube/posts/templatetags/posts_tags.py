@@ -0,0 +1,27 @@
+from django import template
+
+from posts.forms import CommentForm
+from posts import follows, suggestions
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    user = context.get('user')
+    if user is None or not user.is_authenticated:
+        return False
+    return follows.is_following(user.pk, author_id)
+
+
+@register.simple_tag(takes_context=True)
+def suggested_authors(context):
+    user = context.get('user')
+    if user is None or not user.is_authenticated:
+        return []
+    return suggestions.for_user(user.pk)
+
+
+@register.simple_tag
+def comment_form():
+    return CommentForm()
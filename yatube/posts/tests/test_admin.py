@@ -0,0 +1,122 @@
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import counters
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Запросов на страницу списка: сессия, пользователь, размер списка,
+# строки страницы вместе со связанными объектами; у постов ещё
+# группы для list_editable (один раз на страницу) и оценка размера.
+# От числа строк бюджет не зависит.
+QUERY_BUDGETS = {
+    'posts_post': 6,
+    'posts_group': 5,
+    'posts_comment': 5,
+    'posts_follow': 5,
+}
+
+
+class AdminChangelistQueriesTests(TestCase):
+    # Номера для имён: строки добавляются и в тестах, уже после
+    # setUpTestData.
+    numbers = count()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.add_rows(30)
+
+    @classmethod
+    def add_rows(cls, rows):
+        numbers = [next(cls.numbers) for _ in range(rows)]
+        authors = User.objects.bulk_create(
+            User(username=f'author_{number}') for number in numbers
+        )
+        authors = list(User.objects.filter(
+            username__in=[author.username for author in authors]
+        ))
+        groups = Group.objects.bulk_create(
+            Group(title=f'Группа {number}', slug=f'group-{number}',
+                  description='Описание')
+            for number in numbers
+        )
+        groups = list(Group.objects.filter(
+            slug__in=[group.slug for group in groups]
+        ))
+        Post.objects.bulk_create(
+            Post(author=author, group=group, text='Тестовый пост')
+            for author, group in zip(authors, groups)
+        )
+        posts = list(Post.objects.filter(author__in=authors))
+        Comment.objects.bulk_create(
+            Comment(post=post, author=post.author, text='Комментарий')
+            for post in posts
+        )
+        Follow.objects.bulk_create(
+            Follow(user=cls.admin, author=author) for author in authors
+        )
+        # bulk_create обходит сигналы счётчиков
+        counters.reconcile_authors()
+        counters.reconcile_groups()
+        counters.reconcile_posts()
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, table):
+        app_label, model_name = table.split('_', 1)
+        url = reverse(f'admin:{app_label}_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_budget(self):
+        '''Списки в админке укладываются в бюджет запросов'''
+        for table, budget in QUERY_BUDGETS.items():
+            with self.subTest(table=table):
+                self.assertLessEqual(self.changelist_queries(table), budget)
+
+    def test_queries_do_not_grow_with_rows(self):
+        '''Число запросов не растёт с числом строк на странице'''
+        before = {
+            table: self.changelist_queries(table) for table in QUERY_BUDGETS
+        }
+        self.add_rows(30)
+        cache.clear()
+        after = {
+            table: self.changelist_queries(table) for table in QUERY_BUDGETS
+        }
+        self.assertEqual(before, after)
+
+    def test_list_editable_group_saves(self):
+        '''Группа меняется прямо из списка постов'''
+        post = Post.objects.order_by('-pub_date', '-pk').first()
+        group = Group.objects.exclude(pk=post.group_id).first()
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        formset = response.context['cl'].formset
+        data = {
+            f'form-{key}': value
+            for key, value in formset.management_form.initial.items()
+        }
+        for index, form in enumerate(formset.forms):
+            data[f'form-{index}-id'] = form.instance.pk
+            data[f'form-{index}-group'] = form.instance.group_id
+            if form.instance.pk == post.pk:
+                data[f'form-{index}-group'] = group.pk
+        data['_save'] = 'Сохранить'
+        self.client.post(reverse('admin:posts_post_changelist'), data)
+        post.refresh_from_db()
+        self.assertEqual(post.group, group)
@@ -2,13 +2,18 @@ import shutil
 import tempfile
 
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 
+from posts import thumbnails
+from posts.caching import feed_generation
 from posts.models import Comment, Group, Post
 
 User = get_user_model()
@@ -140,6 +145,7 @@ class CommentsTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -174,8 +180,86 @@ class CommentsTests(TestCase):
             follow=True
         )
         self.assertEqual(Comment.objects.count(), comments_count + 1)
+        cache.clear()
         response = self.authorized_client.get(
             reverse('posts:post_detail', kwargs={'post_id': self.post.id})
         )
         comments = response.context['comments']
-        self.assertEqual(comments.first().text, form_data['text'])
+        self.assertEqual(comments[0].text, form_data['text'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TransactionTestCase):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_thumbnail_created_on_upload(self):
+        '''Миниатюра создаётся при сохранении формы, а не при показе'''
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        with mock.patch.object(
+            thumbnails, 'schedule', wraps=thumbnails.schedule
+        ) as schedule:
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой', 'image': uploaded},
+            )
+            self.assertEqual(
+                schedule.call_count, len(settings.POST_THUMBNAILS)
+            )
+            response = self.authorized_client.get(reverse('posts:index'))
+            self.assertEqual(
+                schedule.call_count, len(settings.POST_THUMBNAILS)
+            )
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_missing_thumbnail_not_rendered_inline(self):
+        '''Без готовой миниатюры шаблон получает исходную картинку'''
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('inline.gif', self.small_gif),
+        )
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            )
+        schedule.assert_called_once()
+        self.assertContains(response, post.image.url)
+
+    def test_ready_thumbnail_refreshes_cached_pages(self):
+        '''Готовая миниатюра сбрасывает страницы с исходной картинкой'''
+        cache.clear()
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('refresh.gif', self.small_gif),
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        generation = feed_generation()
+        self.authorized_client.get(url)
+        self.assertNotEqual(feed_generation(), generation)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+        generation = feed_generation()
+        self.authorized_client.get(url)
+        self.assertEqual(feed_generation(), generation)
@@ -1,7 +1,19 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import models
+from django.test import TestCase, override_settings
 
-from ..models import Group, Post
+from ..fastload import iter_json_array
+from ..forms import PostForm
+from ..models import AuthorStats, Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -29,3 +41,196 @@ class PostModelTest(TestCase):
         expected_group_name = group.title
         self.assertEqual(expected_post_name, str(post))
         self.assertEqual(expected_group_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self):
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(stats.posts_count, self.user.posts.count())
+        self.assertEqual(stats.followers_count, self.user.following.count())
+        reader = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual(reader.following_count, self.reader.follower.count())
+        for group in Group.objects.all():
+            self.assertEqual(group.posts_count, group.posts.count())
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Post.objects.create(author=self.user, text='Без группы')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertCounters()
+        # Обычный save() пишет все поля, поэтому берём свежие счётчики.
+        post.refresh_from_db()
+        post.group = self.other_group
+        post.save()
+        self.assertCounters()
+        comment.delete()
+        follow.delete()
+        self.assertCounters()
+        post.delete()
+        self.assertCounters()
+
+    def test_edit_form_keeps_counters(self):
+        """Правка поста через форму не затирает счётчик комментариев."""
+        post = Post.objects.create(author=self.user, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        form = PostForm({'text': 'Новый текст'}, instance=post)
+        self.assertTrue(form.is_valid())
+        form.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.user)
+        AuthorStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7
+        )
+        AuthorStats.objects.filter(user=self.reader).delete()
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounters()
+
+
+DATASET_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=DATASET_MEDIA_ROOT)
+class DatasetTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(DATASET_MEDIA_ROOT, ignore_errors=True)
+
+    def test_generate_dataset(self):
+        """generate_dataset наполняет базу и сводит счётчики."""
+        call_command(
+            'generate_dataset', users=20, groups=3, posts=200,
+            comments=100, follows=5, images=0.1, batch_size=50,
+            stdout=StringIO(),
+        )
+        self.assertEqual(
+            User.objects.filter(username__startswith='synth').count(), 20
+        )
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(
+            Follow.objects.filter(user=models.F('author')).exists()
+        )
+        self.assertTrue(os.listdir(os.path.join(DATASET_MEDIA_ROOT, 'posts')))
+        for stats in AuthorStats.objects.select_related('user'):
+            self.assertEqual(stats.posts_count, stats.user.posts.count())
+            self.assertEqual(
+                stats.followers_count, stats.user.following.count()
+            )
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, post.comments.count())
+
+    def test_generate_after_deleted_rows(self):
+        """Новые pk не обязаны идти сразу за максимальным."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(author=author, text='Пост').delete()
+        User.objects.create_user(username='deleted').delete()
+        call_command(
+            'generate_dataset', users=5, groups=0, posts=20, comments=20,
+            follows=2, stdout=StringIO(),
+        )
+        self.assertFalse(
+            Post.objects.exclude(author__in=User.objects.all()).exists()
+        )
+        self.assertFalse(
+            Comment.objects.exclude(post__in=Post.objects.all()).exists()
+        )
+
+
+class FastloadTest(TestCase):
+    FIXTURE = [
+        {'model': 'auth.user', 'pk': 10, 'fields': {
+            'username': 'loaded', 'password': '!', 'groups': [],
+            'user_permissions': [],
+        }},
+        {'model': 'posts.comment', 'pk': 5, 'fields': {
+            'post': 7, 'author': 10, 'text': 'Комментарий [1]',
+            'created': '2021-01-02T00:00:00Z',
+        }},
+        {'model': 'posts.post', 'pk': 7, 'fields': {
+            'text': 'Пост, "в кавычках" и {скобках}', 'author': 10,
+            'group': None, 'image': '', 'pub_date': '2020-05-01T12:00:00Z',
+        }},
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def assertLoaded(self):
+        post = Post.objects.get(pk=7)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.author.username, 'loaded')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.author.stats.posts_count, 1)
+        self.assertEqual(Comment.objects.get(pk=5).created.year, 2021)
+
+    def test_iter_json_array_small_chunks(self):
+        """Массив разбирается по частям при любом размере куска."""
+        text = json.dumps(self.FIXTURE, ensure_ascii=False, indent=2)
+        for chunk_size in (1, 7, 4096):
+            with self.subTest(chunk_size=chunk_size):
+                objects = list(iter_json_array(StringIO(text), chunk_size))
+                self.assertEqual(objects, self.FIXTURE)
+
+    def test_fastload_json(self):
+        """fastload грузит JSON-массив с датами из фикстуры."""
+        path = os.path.join(self.directory, 'dump.json')
+        with open(path, 'w', encoding='utf-8') as fixture:
+            json.dump(self.FIXTURE, fixture)
+        call_command('fastload', path, batch_size=2, stdout=StringIO())
+        self.assertLoaded()
+
+    def test_fastload_ndjson_gz(self):
+        """fastload грузит сжатый NDJSON и пропускает дубликаты."""
+        path = os.path.join(self.directory, 'dump.ndjson.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as fixture:
+            for obj in self.FIXTURE:
+                fixture.write(json.dumps(obj) + '\n')
+        call_command('fastload', path, stdout=StringIO())
+        call_command(
+            'fastload', path, ignore_conflicts=True, stdout=StringIO()
+        )
+        self.assertLoaded()
+        self.assertEqual(Post.objects.count(), 1)
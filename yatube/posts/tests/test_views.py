@@ -1,15 +1,33 @@
+import gzip
+import json
+import os
 import shutil
 import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Follow, Group, Post
+from core.db import table_estimate
+from core.testing import run_on_commit
+from posts import benchmarks, follows, suggestions
+from posts.caching import bump_suggestions_generation
+from posts.models import (Comment, Follow, Group, Post, Suggestion,
+                          TimelineEntry)
+from posts.paginators import EstimatedCountPaginator, KeysetPaginator
 
 User = get_user_model()
 
@@ -47,6 +65,7 @@ class PostsPagesTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -218,6 +237,7 @@ class ViewsPaginatorTests(TestCase):
         Post.objects.bulk_create(objs)
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -264,10 +284,273 @@ class ViewsPaginatorTests(TestCase):
         self.assertEqual(len(response.context['page_obj']), second_page_count)
 
 
+class EstimatedCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='admin', is_staff=True, is_superuser=True
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text='Тестовый пост') for _ in range(25)
+        )
+        post = Post.objects.first()
+        Comment.objects.bulk_create(
+            Comment(post=post, author=cls.user, text='Комментарий')
+            for _ in range(25)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def count_queries(self, queries, table):
+        return sum(
+            f'SELECT COUNT(*) AS "__count" FROM "{table}"' in query['sql']
+            for query in queries
+        )
+
+    def test_paginator_estimates_large_lists(self):
+        '''Выше порога count — оценка, страниц не больше max_pages'''
+        paginator = EstimatedCountPaginator(
+            Post.objects.order_by('pk'), 10, estimate=lambda: 1000,
+            threshold=100, max_pages=5,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 1000)
+        self.assertEqual(len(queries), 0)
+        self.assertTrue(paginator.estimated)
+        self.assertEqual(paginator.num_pages, 5)
+        page = paginator.page(3)
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next())
+        exact = EstimatedCountPaginator(
+            Post.objects.all(), 10, estimate=50, threshold=100
+        )
+        self.assertEqual(exact.count, 25)
+        self.assertFalse(exact.estimated)
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=10)
+    def test_index_and_admin_without_count(self):
+        '''Главная и списки в админке не считают COUNT(*) по таблице'''
+        for url, table in (
+            (reverse('posts:index'), 'posts_post'),
+            (reverse('admin:posts_post_changelist'), 'posts_post'),
+            (reverse('admin:posts_comment_changelist'), 'posts_comment'),
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.count_queries(queries, table), 0)
+        self.assertContains(
+            self.client.get(reverse('admin:posts_post_changelist')),
+            'примерно 25'
+        )
+        self.assertContains(
+            self.client.get(reverse('posts:index')), 'Примерно 25 записей'
+        )
+
+
+@override_settings(PAGINATION_MODE='keyset')
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        objs = (
+            Post(
+                author=cls.user,
+                text=f'Тестовый пост {i}',
+                group=cls.group
+            ) for i in range(25)
+        )
+        Post.objects.bulk_create(objs)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_keyset_pages_cover_feed(self):
+        '''Курсоры after/before обходят ленту без пропусков и повторов'''
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        pages = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for url in pages:
+            with self.subTest(url=url):
+                seen = []
+                page_obj = self.authorized_client.get(url).context['page_obj']
+                self.assertFalse(page_obj.has_previous())
+                seen.extend(page_obj)
+                while page_obj.has_next():
+                    page_obj = self.authorized_client.get(
+                        url, {'after': page_obj.next_cursor}
+                    ).context['page_obj']
+                    seen.extend(page_obj)
+                self.assertEqual(seen, expected)
+                self.assertEqual(len(page_obj), 5)
+                previous = self.authorized_client.get(
+                    url, {'before': page_obj.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    list(previous), expected[10:20]
+                )
+
+    def test_keyset_page_skips_count(self):
+        '''Глубокая страница не выполняет COUNT и OFFSET'''
+        first = self.authorized_client.get(
+            reverse('posts:index')
+        ).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(
+                reverse('posts:index'), {'after': first.next_cursor}
+            )
+        sql = ' '.join(query['sql'] for query in queries).upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_cursor_starts_index_range(self):
+        '''Курсор начинает диапазон индекса, а не идёт от начала ленты'''
+        post = Post.objects.order_by('pub_date', 'pk').first()
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        feeds = (
+            (Post.objects.feed(), 'pub_date'),
+            (Post.objects.feed().filter(group=self.group), 'pub_date'),
+            (Post.objects.feed().filter(author=self.user), 'pub_date'),
+            (Comment.objects.filter(post=post).thread(), 'created'),
+        )
+        for queryset, date_field in feeds:
+            paginator = KeysetPaginator(queryset, 10, date_field)
+            cursor = paginator.encode_cursor(queryset.first())
+            for direction, bound in (('after', '<?'), ('before', '>?')):
+                with self.subTest(
+                    model=queryset.model.__name__, direction=direction
+                ):
+                    plan = paginator.cursor_queryset(
+                        **{direction: cursor}
+                    ).explain()
+                    self.assertIn(f'{date_field}{bound}', plan)
+                    self.assertNotIn('SCAN', plan)
+
+    def test_broken_cursor_gives_first_page(self):
+        '''Испорченный курсор возвращает первую страницу'''
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': '!!!'}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(Post.objects.order_by('-pub_date', '-pk')[:10])
+        )
+
+
+class FeedQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(settings.QUANTITY + 5):
+            author = User.objects.create_user(username=f'author_{i}')
+            group = Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'group-{i}',
+                description='Описание',
+            )
+            Post.objects.create(author=author, text='Пост', group=group)
+            Post.objects.create(
+                author=cls.user, text='Пост test_user', group=cls.group
+            )
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_feed_query_count(self):
+        '''Число запросов ленты не зависит от числа постов на странице'''
+        # Оценка размера таблицы постов кэшируется на минуту
+        table_estimate(Post)
+        guest_pages = {
+            reverse('posts:index'): 2,
+            reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ): 3,
+            reverse(
+                'posts:profile', kwargs={'username': self.user.username}
+            ): 3,
+        }
+        for url, queries in guest_pages.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(url)
+        # Подписки и рекомендации читаются один раз и дальше
+        # берутся из кэша
+        follows.following_ids(self.user.pk)
+        suggestions.for_user(self.user.pk)
+        # Плюс сумма счётчиков авторов: оценка размера ленты подписок
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+    def test_feed_plans_use_indexes(self):
+        '''Ни один запрос лент не читает таблицу целиком'''
+        call_command('explain_feeds', stdout=StringIO())
+
+    def test_feed_plans_reject_scan_from_head(self):
+        '''Курсор без диапазона по дате не проходит проверку планов'''
+        def boundary(paginator, key, older):
+            date, pk = key
+            field = paginator.date_field
+            return (
+                Q(**{f'{field}__lt': date})
+                | Q(**{field: date, 'pk__lt': pk})
+            )
+
+        with mock.patch.object(KeysetPaginator, '_boundary', boundary):
+            with self.assertRaisesMessage(CommandError, 'profile: after'):
+                call_command('explain_feeds', stdout=StringIO())
+
+    def test_counters_without_aggregates(self):
+        '''Профиль и пост берут счётчики без агрегирующих запросов'''
+        post = Post.objects.filter(author=self.user).first()
+        # В профиле остаётся только COUNT пагинатора
+        urls = {
+            reverse(
+                'posts:profile', kwargs={'username': self.user.username}
+            ): 1,
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}): 0,
+        }
+        for url, expected in urls.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.guest_client.get(url)
+                counts = [
+                    query for query in queries
+                    if 'COUNT(' in query['sql'].upper()
+                ]
+                self.assertEqual(len(counts), expected)
+                self.assertContains(response, settings.QUANTITY + 5)
+
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class ImageInContextTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -285,6 +568,7 @@ class ImageInContextTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -324,6 +608,9 @@ class ImageInContextTests(TestCase):
                 image='posts/small.gif'
             ).exists()
         )
+        # Профиль уже отрендерен и закэширован при переходе после
+        # создания поста, а контекст нужен заново.
+        cache.clear()
         reverse_names = [
             reverse('posts:index'),
             reverse('posts:group_list', kwargs={'slug': self.group.slug}),
@@ -345,7 +632,7 @@ class ImageInContextTests(TestCase):
         self.assertEqual(post_from_response.image, 'posts/small.gif')
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class CacheTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -363,6 +650,7 @@ class CacheTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -372,7 +660,15 @@ class CacheTests(TestCase):
         # Смотрим на страницу перед созданием поста
         response1 = self.guest_client.get(reverse('posts:index'))
         content1 = response1.content
-        # Создаём пост
+        # bulk_create не шлёт сигналов — поколение ленты не меняется
+        Post.objects.bulk_create([
+            Post(author=self.user, text='Пост мимо сигналов')
+        ])
+        response2 = self.guest_client.get(reverse('posts:index'))
+        content2 = response2.content
+        # Убеждаемся, что на странице ничего не изменилось
+        self.assertEqual(content1, content2)
+        # Создаём пост через форму
         small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
             b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -396,17 +692,23 @@ class CacheTests(TestCase):
             data=form_data,
             follow=True
         )
-        # Смотрим на страницу после создания поста
-        response2 = self.guest_client.get(reverse('posts:index'))
-        content2 = response2.content
-        # Убеждаемся, что на странице ничего не изменилось
-        self.assertEqual(content1, content2)
-        # Чистим кэш
-        cache.clear()
-        # Смотрим на страницу после очистки кэша
+        # Сохранение поста сбросило кэш без cache.clear()
         response3 = self.guest_client.get(reverse('posts:index'))
         content3 = response3.content
         self.assertNotEqual(content3, content2)
+        self.assertContains(response3, form_data['text'])
+
+    def test_cache_index_pages(self):
+        '''Страницы index кэшируются под разными ключами'''
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}')
+            for i in range(settings.QUANTITY + 1)
+        )
+        first = self.guest_client.get(reverse('posts:index')).content
+        second = self.guest_client.get(
+            reverse('posts:index') + '?page=2'
+        ).content
+        self.assertNotEqual(first, second)
 
 
 class FollowTests(TestCase):
@@ -423,6 +725,7 @@ class FollowTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.second_user)
 
@@ -514,3 +817,718 @@ class FollowTests(TestCase):
         )
         post_list = response.context['page_obj']
         self.assertEqual(len(post_list), 0)
+
+    def test_follow_set_updated_in_place(self):
+        '''Подписка и отписка правят закэшированные подписки без чтения'''
+        self.assertFalse(
+            follows.is_following(self.second_user.pk, self.user.pk)
+        )
+        profile = reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        )
+        with run_on_commit():
+            self.authorized_client.get(
+                reverse(
+                    'posts:profile_follow',
+                    kwargs={'username': self.user.username}
+                )
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(profile)
+        self.assertTrue(response.context['following'])
+        self.assertFalse(any(
+            'posts_follow' in query['sql'] for query in queries
+        ))
+        self.assertContains(response, 'Отписаться')
+        with run_on_commit():
+            self.authorized_client.get(
+                reverse(
+                    'posts:profile_unfollow',
+                    kwargs={'username': self.user.username}
+                )
+            )
+        self.assertEqual(
+            list(follows.following_ids(self.second_user.pk)), []
+        )
+
+    def test_rolled_back_follow_not_cached(self):
+        '''Откаченная подписка не попадает в кэш'''
+        follows.following_ids(self.second_user.pk)
+        with self.assertRaises(DatabaseError):
+            with run_on_commit(), transaction.atomic():
+                follows.follow(self.second_user.pk, self.user.pk)
+                raise DatabaseError
+        self.assertFalse(
+            follows.is_following(self.second_user.pk, self.user.pk)
+        )
+
+    def test_contended_update_not_lost(self):
+        '''Подписка во время чужой правки массива не теряется'''
+        follows.following_ids(self.second_user.pk)
+        key = follows._key(self.second_user.pk)
+        cache.add(f'{key}:lock', 'other')
+        Follow.objects.create(user=self.second_user, author=self.user)
+        # Держатель блокировки дописывает массив без нашей подписки.
+        cache.set(key, follows._load(self.third_user.pk), follows.TIMEOUT)
+        self.assertTrue(
+            follows.is_following(self.second_user.pk, self.user.pk)
+        )
+        self.assertEqual(cache.get(f'{key}:lock'), 'other')
+
+    def test_repeated_follow_and_unfollow(self):
+        '''Повторные подписка и отписка не падают и не сбивают счётчики'''
+        for name in ('profile_follow', 'profile_follow',
+                     'profile_unfollow', 'profile_unfollow',
+                     'profile_follow'):
+            response = self.authorized_client.get(
+                reverse(f'posts:{name}', kwargs={
+                    'username': self.user.username
+                })
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Follow.objects.filter(
+                user=self.second_user, author=self.user
+            ).count(),
+            1
+        )
+        self.user.stats.refresh_from_db()
+        self.second_user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.followers_count, 1)
+        self.assertEqual(self.second_user.stats.following_count, 1)
+
+    def test_follow_import_endpoint(self):
+        '''Массовая подписка пропускает себя, дубликаты и неизвестных'''
+        Follow.objects.create(user=self.second_user, author=self.user)
+        response = self.authorized_client.post(
+            reverse('posts:follow_import'),
+            json.dumps({'authors': [
+                'test_user_1', 'test_user_2', 'test_user_3',
+                'test_user_3', 'nobody',
+            ]}),
+            content_type='application/json',
+        )
+        self.assertEqual(
+            response.json(), {'followed': 1, 'unknown': ['nobody']}
+        )
+        self.assertTrue(
+            follows.is_following(self.second_user.pk, self.third_user.pk)
+        )
+        self.second_user.stats.refresh_from_db()
+        self.assertEqual(self.second_user.stats.following_count, 2)
+        response = self.authorized_client.post(
+            reverse('posts:follow_import'), 'не json',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_follows_command(self):
+        '''import_follows создаёт подписки пачками из CSV'''
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False
+        ) as stream:
+            stream.write(
+                'test_user_1,test_user_2\n'
+                'test_user_3,test_user_2\n'
+                'test_user_3,test_user_1\n'
+                'test_user_3,nobody\n'
+            )
+        self.addCleanup(os.remove, stream.name)
+        out = StringIO()
+        call_command('import_follows', stream.name, batch_size=2, stdout=out)
+        self.assertIn('Новых подписок: 3', out.getvalue())
+        self.assertEqual(Follow.objects.count(), 3)
+        self.second_user.stats.refresh_from_db()
+        self.assertEqual(self.second_user.stats.followers_count, 2)
+
+    def test_follow_feed_with_many_authors(self):
+        '''Длинный список подписок превращается в подзапрос'''
+        Follow.objects.create(user=self.second_user, author=self.third_user)
+        post = Post.objects.create(author=self.third_user, text='Пост')
+        queryset = Post.objects.all()
+        with mock.patch.object(follows, 'IN_LIMIT', 0):
+            many = follows.followed_posts(queryset, self.second_user.pk)
+        few = follows.followed_posts(queryset, self.second_user.pk)
+        self.assertIn('posts_follow', str(many.query))
+        self.assertNotIn('posts_follow', str(few.query))
+        self.assertEqual(list(many), [post])
+        self.assertEqual(list(few), [post])
+
+
+class SuggestionsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader, cls.author, cls.friend, cls.neighbour, cls.other = (
+            User.objects.create_user(username=name) for name in (
+                'reader', 'author', 'friend', 'neighbour', 'other'
+            )
+        )
+        # reader → author → friend: друг друга.
+        # neighbour тоже читает author, а ещё other: совместная подписка.
+        for user, author in (
+            (cls.reader, cls.author),
+            (cls.author, cls.friend),
+            (cls.neighbour, cls.author),
+            (cls.neighbour, cls.other),
+        ):
+            Follow.objects.create(user=user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def test_friends_of_friends_and_co_follows(self):
+        '''Друзья друзей выше совместных подписок, свои подписки исключены'''
+        suggestions.build()
+        self.assertEqual(
+            list(Suggestion.objects.filter(
+                user=self.reader
+            ).values_list('author', flat=True)),
+            [self.friend.pk, self.other.pk],
+        )
+
+    def test_build_in_worker_processes(self):
+        '''Подсчёт в отдельных процессах даёт тот же результат'''
+        suggestions.build(workers=2, batch_size=1)
+        expected = list(Suggestion.objects.values_list(
+            'user', 'author', 'rank'
+        ))
+        Suggestion.objects.all().delete()
+        suggestions.build()
+        self.assertEqual(
+            list(Suggestion.objects.values_list('user', 'author', 'rank')),
+            expected,
+        )
+
+    def test_build_without_fork(self):
+        '''Без fork подсчёт идёт в текущем процессе'''
+        with mock.patch.object(
+            suggestions.multiprocessing, 'get_all_start_methods',
+            return_value=['spawn'],
+        ), mock.patch.object(
+            suggestions.multiprocessing, 'get_context'
+        ) as get_context:
+            suggestions.build(workers=2)
+        get_context.assert_not_called()
+        self.assertEqual(
+            list(Suggestion.objects.filter(
+                user=self.reader
+            ).values_list('author', flat=True)),
+            [self.friend.pk, self.other.pk],
+        )
+
+    def test_panel_on_follow_and_profile_pages(self):
+        '''Панель показывает рекомендации без уже прочитанных авторов'''
+        call_command('build_suggestions', workers=0, stdout=StringIO())
+        for url in (
+            reverse('posts:follow_index'),
+            reverse('posts:profile', kwargs={'username': 'other'}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Кого почитать')
+                self.assertContains(
+                    response, reverse('posts:profile', args=['friend'])
+                )
+        Follow.objects.create(user=self.reader, author=self.friend)
+        self.assertEqual(suggestions.for_user(self.reader.pk), [self.other])
+
+
+@override_settings(FOLLOW_TIMELINES=True)
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.old_post = Post.objects.create(
+            author=cls.author, text='Пост до подписки'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def follow_page(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follows_writes(self):
+        '''Лента заполняется при подписке и публикации, чистится отпиской'''
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.follow_page(), [self.old_post])
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.follow_page(), [new_post, self.old_post])
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'author'})
+        )
+        self.assertEqual(self.follow_page(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(ESTIMATED_COUNT_THRESHOLD=1)
+    def test_timeline_page_without_count(self):
+        '''Большая лента подписок не считает COUNT(*) по записям ленты'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.follow_page(), [self.old_post])
+        self.assertFalse(any(
+            'COUNT(' in query['sql'].upper()
+            and 'posts_timelineentry' in query['sql']
+            for query in queries
+        ))
+
+    def test_rebuild_timelines(self):
+        '''Команда rebuild_timelines восстанавливает ленты'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.follow_page(), [self.old_post])
+
+
+@override_settings(QUANTITY=2)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.best = Post.objects.create(
+            author=cls.user, text='кошка кошка кошка <b>жирная</b>'
+        )
+        cls.others = [
+            Post.objects.create(
+                author=cls.user,
+                text=f'Пост {i} про кошка и длинный текст ' + 'слово ' * i,
+            )
+            for i in range(4)
+        ]
+        cls.unrelated = Post.objects.create(author=cls.user, text='собака')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, **params):
+        response = self.guest_client.get(reverse('posts:search'), params)
+        return response, response.context['page_obj']
+
+    def test_search_ranked_and_paginated(self):
+        '''Поиск отдаёт релевантные посты по курсорам без повторов'''
+        response, page_obj = self.search(q='кошк')
+        self.assertEqual(page_obj[0], self.best)
+        found = list(page_obj)
+        while page_obj.has_next():
+            _, page_obj = self.search(q='кошк', after=page_obj.next_cursor)
+            found.extend(page_obj)
+        self.assertEqual(len(found), 5)
+        self.assertEqual(set(found), {self.best, *self.others})
+        _, previous = self.search(q='кошк', before=page_obj.previous_cursor)
+        self.assertEqual(list(previous), found[2:4])
+
+    def test_search_snippet_escaped(self):
+        '''Совпадения подсвечиваются, а HTML из текста экранируется'''
+        response, _ = self.search(q='жирная')
+        self.assertContains(response, '<mark>жирная</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_search_index_follows_writes(self):
+        '''Индекс обновляется при изменении и удалении поста'''
+        self.unrelated.text = 'попугай'
+        self.unrelated.save()
+        _, page_obj = self.search(q='попугай')
+        self.assertEqual(list(page_obj), [self.unrelated])
+        self.unrelated.delete()
+        _, page_obj = self.search(q='попугай')
+        self.assertEqual(list(page_obj), [])
+        _, page_obj = self.search(q='" OR *')
+        self.assertEqual(list(page_obj), [])
+
+    def test_admin_search_uses_index(self):
+        '''Поиск в админке находит посты через полнотекстовый индекс'''
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собака'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.unrelated]
+        )
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'generate_dataset', users=10, groups=2, posts=50,
+            comments=20, follows=3, stdout=StringIO(),
+        )
+
+    def test_benchmark_runs_all_views(self):
+        '''Все сценарии отвечают ожидаемым кодом и дают метрики'''
+        results = benchmarks.run(requests=2, warmup=1)
+        self.assertEqual(
+            set(results),
+            {scenario.name for scenario in benchmarks.scenarios(
+                benchmarks.sample()
+            )},
+        )
+        for name, result in results.items():
+            with self.subTest(view=name):
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+                self.assertGreater(result['queries'], 0)
+                self.assertGreater(result['peak_kb'], 0)
+
+    def test_benchmark_warm_uses_page_cache(self):
+        '''В режиме warm анонимные страницы отдаются из кэша страниц'''
+        results = benchmarks.run(
+            requests=2, warmup=1, warm=True, only=['index']
+        )
+        self.assertEqual(results['index']['queries'], 0)
+
+    def test_benchmark_compare(self):
+        '''Регрессией считаются лишние запросы и заметное замедление'''
+        base = {'p50_ms': 10, 'p95_ms': 20, 'queries': 3, 'peak_kb': 500}
+        baseline = {'index': base, 'profile': base}
+        noise = dict(base, p95_ms=21.5, peak_kb=550)
+        self.assertEqual(
+            benchmarks.compare({'index': noise, 'new': base}, baseline), []
+        )
+        slower = dict(base, p95_ms=30, queries=4)
+        regressions = benchmarks.compare(
+            {'index': base, 'profile': slower}, baseline
+        )
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(
+            line.startswith('profile') for line in regressions
+        ))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Тест',
+        )
+        cls.old = Post.objects.create(author=cls.user, text='Старый пост')
+        Post.objects.filter(pk=cls.old.pk).update(
+            pub_date=datetime(2020, 1, 1, tzinfo=timezone.utc)
+        )
+        cls.new = Post.objects.create(
+            author=cls.user, text='Новый пост', group=cls.group
+        )
+        Comment.objects.create(post=cls.new, author=cls.reader, text='Ок')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        response = self.client.get(reverse('posts:export'), params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        if params.get('gzip'):
+            self.assertEqual(response['Content-Type'], 'application/gzip')
+            content = gzip.decompress(content)
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def models(self, records):
+        return [record['model'] for record in records]
+
+    def test_export_full(self):
+        '''Выгрузка отдаёт все объекты в формате фикстур'''
+        records = self.export()
+        self.assertEqual(self.models(records), [
+            'posts.group', 'posts.post', 'posts.post', 'posts.comment',
+            'posts.follow',
+        ])
+        self.assertEqual(records[2]['fields']['text'], 'Новый пост')
+        self.assertEqual(self.export(gzip='1'), records)
+
+    def test_export_since(self):
+        '''С since выгружаются только новые посты, комментарии и подписки'''
+        records = self.export(since='2021-01-01')
+        self.assertEqual(self.models(records), [
+            'posts.group', 'posts.post', 'posts.comment', 'posts.follow',
+        ])
+        self.assertEqual(records[1]['pk'], self.new.pk)
+        response = self.client.get(reverse('posts:export'), {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_admin_only(self):
+        '''Выгрузка недоступна обычным пользователям'''
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts:export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_command_roundtrip(self):
+        '''export_data пишет gzip, который загружается через fastload'''
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'export.ndjson.gz')
+        try:
+            call_command('export_data', output=path, stdout=StringIO())
+            Post.objects.all().delete()
+            call_command('fastload', path, ignore_conflicts=True,
+                         stdout=StringIO())
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(
+            set(Post.objects.values_list('pk', flat=True)),
+            {self.old.pk, self.new.pk},
+        )
+        self.assertEqual(Comment.objects.get().post, self.new)
+
+
+class FollowCreatedMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('posts', target)])
+        return executor.loader.project_state([('posts', target)]).apps
+
+    def tearDown(self):
+        graph = MigrationExecutor(connection).loader.graph
+        self.migrate(graph.leaf_nodes('posts')[0][1])
+
+    def test_old_follows_have_no_date(self):
+        '''Подписки, сделанные до поля created, не попадают в --since'''
+        apps = self.migrate('0011_feed_indexes')
+        OldUser = apps.get_model('auth', 'User')
+        user = OldUser.objects.create(username='reader')
+        author = OldUser.objects.create(username='author')
+        apps.get_model('posts', 'Follow').objects.create(
+            user_id=user.pk, author_id=author.pk
+        )
+        apps = self.migrate('0012_follow_created')
+        self.assertEqual(list(
+            apps.get_model('posts', 'Follow').objects.values_list(
+                'created', flat=True
+            )
+        ), [None])
+
+
+@override_settings(COMMENTS_PER_PAGE=4)
+class CommentsPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.create_user(username=f'reader_{i}'),
+                text=f'Комментарий {i}',
+            )
+            for i in range(10)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def detail_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', args=[self.post.pk])
+            )
+        return response, len(queries)
+
+    def test_detail_renders_first_page(self):
+        '''На странице поста только первая страница комментариев'''
+        response, queries = self.detail_queries()
+        page = response.context['comments']
+        self.assertEqual(
+            [comment.pk for comment in page],
+            [comment.pk for comment in self.comments[:-5:-1]],
+        )
+        self.assertContains(response, page.next_cursor)
+        self.assertNotContains(response, 'Комментарий 0<')
+        for i in range(10, 30):
+            Comment.objects.create(
+                post=self.post,
+                author=User.objects.create_user(username=f'reader_{i}'),
+                text=f'Комментарий {i}',
+            )
+        self.assertEqual(self.detail_queries()[1], queries)
+        with self.settings(COMMENTS_PER_PAGE=8):
+            self.assertEqual(self.detail_queries()[1], queries)
+
+    def test_load_more_comments(self):
+        '''Догрузка отдаёт остальные комментарии без повторов'''
+        page = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk])
+        ).context['comments']
+        seen = list(page)
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        while page.has_next():
+            with self.assertNumQueries(2):
+                response = self.client.get(url, {'after': page.next_cursor})
+            self.assertTemplateUsed(
+                response, 'posts/includes/comments_page.html'
+            )
+            page = response.context['comments']
+            seen.extend(page)
+        self.assertEqual(seen, self.comments[::-1])
+        self.assertNotContains(response, 'Показать ещё')
+        response = self.client.get(
+            reverse('posts:post_comments', args=[self.post.pk + 1])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Тест',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Тестовый пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+            reverse('posts:post_comments', args=[self.post.pk]),
+        ]
+
+    def etags(self, client=None):
+        client = client or self.client
+        return {url: client.get(url)['ETag'] for url in self.urls}
+
+    def test_unchanged_pages_not_modified(self):
+        '''Неизменившиеся страницы отдают 304 без шаблонов и запросов'''
+        for url, etag in self.etags().items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+        self.assertEqual(len(set(self.etags().values())), len(self.urls))
+
+    def test_writes_change_etags(self):
+        '''Новый пост, комментарий или вход пользователя меняют ETag'''
+        etags = self.etags()
+        Post.objects.create(author=self.user, text='Ещё пост')
+        after_post = self.etags()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertNotEqual(after_post[url], etags[url])
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        after_comment = self.etags()
+        self.assertEqual(
+            after_comment[self.urls[0]], after_post[self.urls[0]]
+        )
+        self.assertNotEqual(
+            after_comment[self.urls[4]], after_post[self.urls[4]]
+        )
+        member = Client()
+        member.force_login(self.user)
+        url = self.urls[4]
+        response = member.get(url, HTTP_IF_NONE_MATCH=after_comment[url])
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_suggestions_change_profile_etag(self):
+        '''Пересчёт рекомендаций меняет ETag страниц с «Кого почитать»'''
+        etags = self.etags()
+        bump_suggestions_generation()
+        after = self.etags()
+        for url in self.urls:
+            with self.subTest(url=url):
+                if url == self.urls[3]:
+                    self.assertNotEqual(after[url], etags[url])
+                else:
+                    self.assertEqual(after[url], etags[url])
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост <!--hole:0:0-->'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.member = Client()
+        self.member.force_login(self.reader)
+        self.profile_url = reverse('posts:profile', args=['author'])
+        self.detail_url = reverse('posts:post_detail', args=[self.post.pk])
+
+    def test_anonymous_pages_cached(self):
+        '''Анонимные страницы отдаются из кэша без запросов к базе'''
+        for url in (reverse('posts:index'), self.detail_url):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.client.get(url)
+                self.assertEqual(first.content, second.content)
+                self.assertContains(second, '&lt;!--hole:0:0--&gt;')
+                self.assertContains(second, 'Войти')
+
+    def test_user_fragments_rendered_per_request(self):
+        '''Пользователь получает общую страницу со своими фрагментами'''
+        self.client.get(self.profile_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.member.get(self.profile_url)
+        self.assertFalse(any(
+            'posts_post' in query['sql'] for query in queries
+        ))
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Войти')
+        with run_on_commit():
+            self.member.get(reverse('posts:profile_follow', args=['author']))
+        self.assertContains(self.member.get(self.profile_url), 'Отписаться')
+        self.assertContains(self.client.get(self.profile_url), 'Подписаться')
+        response = self.member.get(self.detail_url)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertNotContains(response, 'редактировать запись')
+        self.member.force_login(self.author)
+        response = self.member.get(self.detail_url)
+        self.assertContains(response, 'редактировать запись')
+
+    def test_page_key_ignores_unknown_params(self):
+        '''Посторонние параметры запроса не создают новых записей кэша'''
+        url = reverse('posts:index')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url + '?utm_source=mail&ref=1')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url + '?page=2')
+        self.assertTrue(queries)
+
+    def test_writes_invalidate_pages(self):
+        '''Новые посты и комментарии сразу видны анонимам'''
+        self.client.get(reverse('posts:index'))
+        self.client.get(self.detail_url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        self.assertContains(self.client.get(reverse('posts:index')),
+                            'Свежий пост')
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Свежий комментарий'
+        )
+        self.assertContains(self.client.get(self.detail_url),
+                            'Свежий комментарий')
@@ -0,0 +1,124 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .caching import bump_feed_generation
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Миниатюры в очереди: ключ -> сбросить ли кэш страниц по готовности.
+_pending = {}
+
+
+def _get_executor():
+    # Пул создаётся при первом обращении, то есть уже в процессе
+    # воркера, а не в мастере gunicorn до fork().
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def generate(name, geometry, options):
+    """Создаёт миниатюру в текущем потоке, если её ещё нет."""
+    return ThumbnailBackend().get_thumbnail(name, geometry, **options)
+
+
+def _run(key):
+    done = False
+    try:
+        generate(*key[:2], dict(key[2]))
+        done = True
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', key[0])
+    finally:
+        with _executor_lock:
+            invalidate = _pending.pop(key, False)
+    if done and invalidate:
+        # Страницы, отрисованные без миниатюры, лежат в кэше лент и
+        # страниц с исходной картинкой: новое поколение их заменит.
+        bump_feed_generation()
+
+
+def _run_in_pool(key):
+    try:
+        _run(key)
+    finally:
+        # У потока пула своё соединение с БД (kvstore sorl)
+        close_old_connections()
+
+
+def schedule(name, geometry, options, invalidate=False):
+    """Ставит миниатюру в очередь; повторные запросы не дублируются.
+
+    invalidate — миниатюры не хватило шаблону: когда она будет готова,
+    сбросить закэшированные ленты и страницы постов.
+    """
+    key = (name, geometry, tuple(sorted(options.items())))
+    with _executor_lock:
+        if key in _pending:
+            _pending[key] = _pending[key] or invalidate
+            return
+        _pending[key] = invalidate
+    if settings.THUMBNAIL_WORKERS:
+        _get_executor().submit(_run_in_pool, key)
+    else:
+        _run(key)
+
+
+def pregenerate(image):
+    """Ставит в очередь все миниатюры картинки, которые есть в шаблонах."""
+    if not image:
+        return
+    for geometry, options in settings.POST_THUMBNAILS:
+        schedule(image.name, geometry, dict(options))
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    """Не рисует миниатюры во время запроса.
+
+    Если миниатюры ещё нет, она ставится в очередь фонового пула,
+    а шаблон получает исходную картинку; когда миниатюра готова,
+    поколение лент меняется, и кэш страниц с исходной картинкой
+    перерисовывается.
+    """
+
+    def _thumbnail_file(self, source, geometry_string, options):
+        # Те же умолчания, что и в ThumbnailBackend.get_thumbnail:
+        # от них зависит имя файла миниатюры.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        thumbnail = self._thumbnail_file(source, geometry_string, options)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        schedule(source.name, geometry_string, options, invalidate=True)
+        return source
@@ -1,75 +1,156 @@
+import json
+
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import (HttpResponseBadRequest, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition, require_POST
+
+from core.db import table_estimate
+from core.page_cache import cache_page_shell
 
+from . import follows
+from .caching import (feed_etag, feed_generation, feed_version, post_etag,
+                      post_version, profile_etag)
+from .counters import get_author_stats
+from .export import export_name, gzip_chunks, iter_chunks, parse_since
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .models import Group, Post, TimelineEntry
+from .paginators import EstimatedCountPaginator, KeysetPaginator
+from .search import SearchPaginator
 
 User = get_user_model()
 
 
-def posts_paginator(request, post_list):
-    paginator = Paginator(post_list, settings.QUANTITY)
+def posts_paginator(request, post_list, estimate=None):
+    """Страница ленты; estimate — примерный размер для больших лент."""
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.PAGINATION_MODE == 'keyset' or after or before:
+        paginator = KeysetPaginator(post_list, settings.QUANTITY)
+        return paginator.get_cursor_page(after=after, before=before)
+    paginator = EstimatedCountPaginator(
+        post_list, settings.QUANTITY, estimate=estimate
+    )
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
 
 
+@condition(etag_func=feed_etag)
+@cache_page_shell(feed_version)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
-    page_obj = posts_paginator(request, post_list)
+    post_list = Post.objects.feed()
+    page_obj = posts_paginator(
+        request, post_list, estimate=lambda: table_estimate(Post)
+    )
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'feed_generation': feed_generation(),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@condition(etag_func=feed_etag)
+@cache_page_shell(feed_version)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = posts_paginator(request, post_list)
+    post_list = group.posts.feed()
+    page_obj = posts_paginator(
+        request, post_list, estimate=group.posts_count
+    )
     context = {
         'group': group,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'feed_generation': feed_generation(),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
+@condition(etag_func=profile_etag)
+@cache_page_shell(feed_version)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = user.posts.all()
-    page_obj = posts_paginator(request, post_list)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    stats = get_author_stats(user)
+    post_list = user.posts.feed()
+    page_obj = posts_paginator(
+        request, post_list, estimate=stats.posts_count
+    )
     following = False
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user
-        ).filter(author=user).exists()
+        following = follows.is_following(request.user.pk, user.pk)
     context = {
         'following': following,
         'page_obj': page_obj,
-        'username': user
+        'stats': stats,
+        'username': user,
+        'feed_generation': feed_generation(),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def comments_page(request, post):
+    """Страница комментариев поста по курсору ?after=."""
+    paginator = KeysetPaginator(
+        post.comments.thread(), settings.COMMENTS_PER_PAGE,
+        date_field='created',
+    )
+    return paginator.get_cursor_page(after=request.GET.get('after'))
+
+
+@condition(etag_func=post_etag)
+@cache_page_shell(post_version)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm()
-    count = post.author.posts.count()
+    count = get_author_stats(post.author).posts_count
     context = {
         'post': post,
         'count': count,
         'form': form,
-        'comments': comments
+        'comments': comments_page(request, post),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@condition(etag_func=post_etag)
+def post_comments(request, post_id):
+    """Кусок HTML со следующей страницей комментариев для «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(request, post),
+    }
+    return render(request, 'posts/includes/comments_page.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, settings.QUANTITY)
+    page_obj = paginator.get_cursor_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None,)
     if form.is_valid():
@@ -81,6 +162,7 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if request.user != post.author:
@@ -101,6 +183,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST)
@@ -115,36 +198,96 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    favorites = Follow.objects.values_list('author').filter(user=request.user)
-    post_list = Post.objects.filter(
-        author__in=favorites
-    )
-    page_obj = posts_paginator(request, post_list)
+    if settings.FOLLOW_TIMELINES:
+        entries = TimelineEntry.objects.filter(
+            user=request.user
+        ).select_related('post__author', 'post__group')
+        # Сумма постов авторов не меньше длины ленты (при подписке в
+        # неё попадают лишь TIMELINE_BACKFILL постов): на больших лентах
+        # пагинатор обходится без COUNT(*), лишние страницы он обрежет.
+        page_obj = posts_paginator(
+            request, entries,
+            estimate=lambda: follows.followed_posts_count(request.user.pk)
+        )
+        page_obj.object_list = [entry.post for entry in page_obj]
+    else:
+        post_list = follows.followed_posts(
+            Post.objects.feed(), request.user.pk
+        )
+        page_obj = posts_paginator(
+            request, post_list,
+            estimate=lambda: follows.followed_posts_count(request.user.pk)
+        )
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'feed_generation': feed_generation(),
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, template, context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
-    user = request.user
     author = get_object_or_404(User, username=username)
-    if user != author:
-        Follow.objects.get_or_create(
-            user=user,
-            author=author,
-        )
+    if request.user != author:
+        follows.follow(request.user.pk, author.pk)
     return redirect('posts:profile', username=author.username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    unfollowing = Follow.objects.filter(
-        user=request.user
-    ).get(
-        author=author
-    )
-    unfollowing.delete()
+    follows.unfollow(request.user.pk, author.pk)
     return redirect('posts:profile', username=author.username)
+
+
+@login_required
+@require_POST
+def follow_import(request):
+    """Массовая подписка: JSON {"authors": ["username", ...]}.
+
+    Отвечает числом новых подписок и списком неизвестных имён.
+    """
+    try:
+        authors = json.loads(request.body)['authors']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest('Ожидается {"authors": [...]}')
+    if not isinstance(authors, list) or not all(
+        isinstance(author, str) for author in authors
+    ):
+        return HttpResponseBadRequest('authors — список имён')
+    if len(authors) > settings.FOLLOW_IMPORT_LIMIT:
+        return HttpResponseBadRequest(
+            f'Не больше {settings.FOLLOW_IMPORT_LIMIT} авторов за раз'
+        )
+    ids = follows.resolve(authors)
+    followed = follows.import_pairs(
+        (request.user.pk, author_id) for author_id in ids.values()
+    )
+    return JsonResponse({
+        'followed': followed,
+        'unknown': sorted(set(authors) - set(ids)),
+    })
+
+
+@staff_member_required
+def export(request):
+    """Потоковая выгрузка в NDJSON: ?since=<дата>, ?gzip=1."""
+    since = request.GET.get('since')
+    try:
+        since = parse_since(since) if since else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    compress = request.GET.get('gzip') == '1'
+    chunks = iter_chunks(since)
+    content_type = 'application/x-ndjson; charset=utf-8'
+    if compress:
+        chunks = gzip_chunks(chunks)
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_name(since, compress)}"'
+    )
+    return response
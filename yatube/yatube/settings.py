@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +68,8 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, засекающий время отрисовки для /metrics/
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,6 +88,32 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 # yatube/settings.py
 QUANTITY = 10
+# Комментариев на странице поста и в каждой догрузке.
+COMMENTS_PER_PAGE = 20
+# 'page' — нумерованные страницы (COUNT + OFFSET),
+# 'keyset' — курсоры ?after=/?before= по (pub_date, id)
+PAGINATION_MODE = 'page'
+# Списки длиннее (по счётчикам или статистике таблицы) пагинируются
+# без COUNT(*): показывается «примерно N» и не больше
+# ESTIMATED_MAX_PAGES страниц (posts.paginators.EstimatedCountPaginator).
+ESTIMATED_COUNT_THRESHOLD = 50000
+ESTIMATED_MAX_PAGES = 1000
+# Время жизни кэша фрагментов лент; сбрасывается при изменении данных
+FEED_CACHE_TIMEOUT = 60 * 5
+# Страницы лент и постов целиком (core.page_cache); ключ меняется
+# с поколением лент, так что срок — лишь страховка. 0 — не кэшировать.
+PAGE_CACHE_TIMEOUT = 60 * 5
+# Материализованные ленты подписок (posts.TimelineEntry).
+# После включения заполните их: python manage.py rebuild_timelines
+FOLLOW_TIMELINES = False
+# Сколько последних постов автора добавлять в ленту при подписке
+TIMELINE_BACKFILL = 1000
+# Сколько авторов можно передать за раз в posts:follow_import
+FOLLOW_IMPORT_LIMIT = 5000
+# Рекомендаций на читателя, которые считает build_suggestions,
+# и сколько из них показывать в панели «Кого почитать».
+SUGGESTIONS_PER_USER = 20
+SUGGESTIONS_SHOWN = 5
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -104,11 +132,31 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3, но транзакции — BEGIN IMMEDIATE
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами: PRAGMA выполняются один раз
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            # Сколько секунд ждать снятия блокировки, а не падать
+            # с «database is locked»
+            'timeout': 5,
+        },
     }
 }
 
+# Применяются к каждому новому соединению (core.db.apply_sqlite_pragmas).
+# WAL позволяет читать во время записи; synchronous=NORMAL в режиме WAL
+# не теряет целостность, только последние транзакции при сбое ОС.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -152,9 +200,39 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        # Небольшой LRU в памяти процесса (L1) перед общим кэшем 'shared'
+        # (L2): самые горячие ключи не ходят даже в файл кэша.
+        # Попадания и промахи считаются для /metrics/.
+        'BACKEND': 'core.cache.InstrumentedTieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'L1_SKIP_SUFFIXES': [':lock'],
+        },
+    },
+    'shared': {
+        # Файл SQLite, общий для всех воркеров: попадания не делятся
+        # между процессами, а сброс поколения виден всем сразу.
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
+# Тесты получают тот же кэш, но в отдельном временном файле
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Миниатюры создаются фоновым пулом, а не при первом показе шаблона
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+# Размер пула; 0 — создавать миниатюры сразу, в текущем потоке
+THUMBNAIL_WORKERS = 2
+# Все миниатюры постов, которые используют шаблоны ({% thumbnail %})
+POST_THUMBNAILS = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
 
 INTERNAL_IPS = [
     '127.0.0.1',